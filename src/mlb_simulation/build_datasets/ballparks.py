@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+
+def ballpark_years(ballpark_info: pd.DataFrame, last_year: int, team_column: str = "home_team") -> pd.DataFrame:
+    """
+    Resolves the ballpark sheet into one row per (home_team, year), so the builders can attach stadiums to plays with a
+    plain keyed join that can never duplicate or drop a play. A stadium covers the years from its Start Date up to the
+    Start Date of the team's next stadium, and the team's latest stadium runs through last_year. The sheet's End Dates
+    aren't used: they mix inclusive and exclusive ends (Turner Field ends in 2016 and Truist Park starts in 2017, while
+    the Rogers Centre ends in 2020, the year Sahlen Field starts), so reading them either way leaves some team seasons
+    with no stadium or with two.
+
+    Parameters:
+        ballpark_info (DataFrame): The ballpark sheet, with Stadium, Start Date and a team column.
+        last_year (int): The last year to resolve stadiums for, usually the year of the latest play.
+        team_column (str): The name of the sheet's team column. Defaults to "home_team".
+
+    Returns:
+        DataFrame: The columns home_team, year and Stadium, unique on (home_team, year).
+    """
+    intervals = (ballpark_info.rename(columns={team_column: "home_team"})[["home_team", "Stadium", "Start Date"]]
+                 .sort_values(["home_team", "Start Date"], kind="stable").reset_index(drop=True))
+    intervals["Start Date"] = intervals["Start Date"].astype(int)
+
+    duplicated = intervals.duplicated(["home_team", "Start Date"])
+    if duplicated.any():
+        raise ValueError(f"Teams with two stadiums starting the same year: {sorted(intervals.home_team[duplicated].unique())}")
+
+    # Each stadium ends where the team's next one starts
+    end_years = intervals.groupby("home_team")["Start Date"].shift(-1).fillna(last_year + 1).astype(int)
+    lengths = (end_years - intervals["Start Date"]).clip(lower=0)
+
+    ballparks = intervals.loc[intervals.index.repeat(lengths)]
+    ballparks["year"] = ballparks["Start Date"] + ballparks.groupby(level=0).cumcount()
+
+    return ballparks[["home_team", "year", "Stadium"]].reset_index(drop=True)
+
+def resolve_ballparks(home_teams, years, ballparks: pd.DataFrame) -> pd.Series:
+    """
+    Looks up the stadium of every play in the output of `ballpark_years`.
+
+    Parameters:
+        home_teams (Series): The home team of each play.
+        years (Series): The year of each play.
+        ballparks (DataFrame): The output of `ballpark_years`.
+
+    Returns:
+        Series: The stadium of each play, aligned with home_teams.
+
+    Raises:
+        ValueError: If any play's team and year has no stadium.
+    """
+    stadiums = ballparks.set_index(["home_team", "year"]).Stadium
+
+    # Look up each distinct (team, year) once, then spread the stadiums over the plays. Pairs are factorized as single
+    # integer keys, which is much faster than factorizing (team, year) tuples
+    team_codes, teams = pd.factorize(np.asarray(home_teams))
+    codes, keys = pd.factorize(team_codes.astype("int64") * 10000 + np.asarray(years, dtype="int64"))
+    pair_stadiums = stadiums.reindex(pd.MultiIndex.from_arrays([teams[keys // 10000], keys % 10000]))
+    if pair_stadiums.isna().any():
+        raise ValueError(f"No ballpark for (home_team, year): {list(pair_stadiums.index[pair_stadiums.isna()])}")
+
+    return pd.Series(pair_stadiums.values[codes], index=getattr(home_teams, "index", None))
@@ -30,4 +30,8 @@ RELEVANT_PLAY_TYPES = ["field_out", "strikeout", "strikeout_double_play", "force
 # For converting/combining play title syntax of raw statcast data
 PLAY_TYPE_DICT = {"field_out":"field_out", "strikeout":"strikeout", "strikeout_double_play":"strikeout", "force_out":"field_out", "grounded_into_double_play":"double_play", "double_play":"double_play", "fielders_choice":"fielders_choice",
                     "fielders_choice_out":"fielders_choice", "other_out":"field_out", "sac_fly":"sacrifice", "sac_bunt":"sacrifice", "single":"single", "double":"double", "triple":"triple", "home_run":"home_run", 
-                    "walk":"walk", "hit_by_pitch":"walk", "intent_walk":"intent_walk", "field_error":"error"}
\ No newline at end of file
+                    "walk":"walk", "hit_by_pitch":"walk", "intent_walk":"intent_walk", "field_error":"error"}
+# Outs recorded by each raw statcast event (every other event records none), for the state after the last play of a half inning
+EVENT_OUTS = {"field_out":1, "strikeout":1, "force_out":1, "fielders_choice_out":1, "other_out":1, "sac_fly":1, "sac_bunt":1,
+              "strikeout_double_play":2, "grounded_into_double_play":2, "double_play":2, "sac_fly_double_play":2,
+              "sac_bunt_double_play":2, "triple_play":3}
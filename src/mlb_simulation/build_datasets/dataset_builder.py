@@ -19,10 +19,11 @@ from IPython.display import clear_output
 
 from multimodal_communication import cloud_functions as cf
 import build_datasets.constants as constants
+from build_datasets.ballparks import ballpark_years, resolve_ballparks
 from build_datasets.utils import (_correct_home_away_swap,
                    _get_wind_direction,
                    _convert_wind_direction,
-                   _pull_full_weather,
+                   _join_full_weather,
                    _segregate_plays_by_pitbat_combo
 )
 
@@ -32,6 +33,7 @@ class DatasetBuilder():
     def __init__(self, rolling_windows=[75, 504], verbose=False):
         self.rolling_windows = rolling_windows
         self.verbose = verbose
+        self.unmatched_weather_games = None # Set by clean_raw_pitches
 
     ######################################################################################
     # Clean Pitch Data
@@ -110,19 +112,24 @@ class DatasetBuilder():
         total_weather_df = total_weather_df.drop(
             columns=['home_team', 'away_team'])
 
-        # Attatch the raw weather string to the the play by matching the date and home team -- we've also added the away team clause to not throw errors on the limited number of g ames coded wrong where in pitches data the teams didn't play eachother and were both on the road
-        final_plays["full_weather"] = final_plays.apply(lambda x: _pull_full_weather(
-            x.game_date, x.home_team, x.away_team, total_weather_df), axis=1)
+        # Attatch the raw weather string to the the play by joining on the date and home team -- we've also added the away team fallback to not throw errors on the limited number of g ames coded wrong where in pitches data the teams didn't play eachother and were both on the road
+        final_plays["full_weather"], unmatched_games = _join_full_weather(final_plays, total_weather_df)
+        self.unmatched_weather_games = unmatched_games
+        if self.verbose and unmatched_games:
+            print(f"No weather found for {unmatched_games} games, they were given dome weather")
 
-        # Break up the full weather info into temp, wind speed, and wind direction seperately
-        final_plays["temprature"] = final_plays.full_weather.apply(
+        # Break up the full weather info into temp, wind speed, and wind direction seperately (once per distinct weather string)
+        parsed_weather = pd.DataFrame(index=final_plays.full_weather.unique())
+        parsed_weather["temprature"] = parsed_weather.index.map(
             lambda x: int(x.split(": ")[1].split("°")[0]))
-        final_plays["wind_speed"] = final_plays.full_weather.apply(
+        parsed_weather["wind_speed"] = parsed_weather.index.map(
             lambda x: int(x.split("Wind ")[1].split("mph")[0]) if "Wind" in x else 0)
-        final_plays["wind_direction"] = final_plays.full_weather.apply(
+        parsed_weather["wind_direction"] = parsed_weather.index.map(
             _get_wind_direction)
-        final_plays["wind_direction"] = final_plays.wind_direction.apply(
+        parsed_weather["wind_direction"] = parsed_weather.wind_direction.apply(
             lambda x: x.split(", ")[0] if x != None else x)
+        for column in ["temprature", "wind_speed", "wind_direction"]:
+            final_plays[column] = final_plays.full_weather.map(parsed_weather[column])
 
         # Convert the wind direction text column into a one-hot encoded set of columns multiplied by the wind speed (yields individual columns representing total wind speed)
         final_plays = _convert_wind_direction(
@@ -138,9 +145,10 @@ class DatasetBuilder():
             ballpark_info = pd.read_excel("data/non_mlb_data/Ballpark Info.xlsx", header=2)[
                 ["Stadium", "Team", "Start Date", "End Date"]]
 
-        # Create a column for the ballpark based on the date and home_team of each pitch
-        final_plays["ballpark"] = final_plays.apply(lambda x: ballpark_info[(ballpark_info.Team.values == x.home_team) & (
-            ballpark_info["End Date"].values > int(x.game_date.split("-")[0]))].Stadium.iloc[0], axis=1)
+        # Create a column for the ballpark based on the year and home_team of each pitch
+        years = final_plays.game_date.str[:4].astype(int)
+        ballparks = ballpark_years(ballpark_info, years.max(), team_column="Team")
+        final_plays["ballpark"] = resolve_ballparks(final_plays.home_team, years, ballparks)
 
         ############ Divide pitches by pitbat combos in 4 dataframes ############
         all_plays_by_pitbat_combo = _segregate_plays_by_pitbat_combo(
@@ -166,53 +174,21 @@ class DatasetBuilder():
             new column `game_play_share`, representing the percentage of each play type in each game.
         """
 
-        game_play_shares = {x: {} for x in constants.HAND_COMBOS}
-        n = 0
-
-        # Build a dictionary of all the game play shares for quicker insertion later
-        for pitbat_combo in constants.HAND_COMBOS:
-            full_df = all_plays_by_pitbat_combo[pitbat_combo].copy()
-            # For each game
-            for game in full_df.game_pk.unique():  # this might be able to become a groupby
-                clear_output(wait=True)
-
-                # Slice all pitches to just the individual game
-                game_df = full_df[full_df.game_pk.values == game].copy()
-                total_plays = len(game_df)
-
-                # Calculate the total number of the play in the specific game by rolling 'type counter' within each play type and finding the max
-                game_df["type_counter"] = game_df[["play_type", "game_pk", "type_counter"]].groupby(
-                    by="play_type").cumsum().type_counter
-                game_df = game_df[["play_type", "game_pk", "type_counter"]].groupby(
-                    by="play_type").max()
-
-                # Calculate the play share for each play type within the specific game by dividing the rolled counter by the total plays in the game
-                game_df["play_share"] = game_df.type_counter/total_plays
-
-                # Insert the game play shares for the specific game into a larger dictionary holder for later reference
-                game_play_shares[pitbat_combo][game] = game_df
-
-                # Update the counter and reprint to inform user of the current position
-                if self.verbose:
-                    if n % 10000 == 0:
-                        print("Calculating The Play Share by Play Type for Each Game. There are {}K Instances Remaining".format(
-                            round((sum([len(all_plays_by_pitbat_combo[x].game_pk.unique()) for x in constants.HAND_COMBOS])-n)/1000), 6))
-                    n += 1
-                clear_output(wait=True)
-
         plays_by_pitbat_combo_with_play_shares = {}
-        # Add a column in the all plays dfs that is the game play share for the specific game and play type of each play
         for pitbat_combo in constants.HAND_COMBOS:
             if self.verbose:
-                print("Inserting Play Shares by Play Type from Each Game To the All Pitches Data Set. There are {} Pitbat Combos Remaining".format(
+                print("Calculating The Play Share by Play Type for Each Game. There are {} Pitbat Combos Remaining".format(
                     len(constants.HAND_COMBOS) - constants.HAND_COMBOS.index(pitbat_combo)))
                 clear_output(wait=True)
 
-            # The if statement in the apply below is used to catch the rare case (n=2 PA in 2018-2019) where the game_pk = <NA>. When this happens the play associated is in the game itself, but does not make it into the
-            # game_play_shares dict which throws and error when pulling the play type from the dictionary
             game_play_df = all_plays_by_pitbat_combo[pitbat_combo].copy()
-            game_play_df["game_play_share"] = game_play_df.apply(
-                lambda x: game_play_shares[pitbat_combo][x.game_pk].loc[x.play_type].play_share if x.play_type in game_play_shares[pitbat_combo][x.game_pk].index else 0, axis=1)
+
+            # Total each play type within each game and divide by the number of plays in the game, all in one grouped pass
+            play_type_totals = game_play_df.groupby(["game_pk", "play_type"]).type_counter.transform("sum")
+            game_totals = game_play_df.groupby("game_pk").type_counter.transform("size")
+
+            # Plays with a game_pk of <NA> (n=2 PA in 2018-2019) don't fall in any group, and get a share of 0
+            game_play_df["game_play_share"] = (play_type_totals / game_totals).fillna(0)
 
             plays_by_pitbat_combo_with_play_shares[pitbat_combo] = game_play_df
 
@@ -220,8 +196,8 @@ class DatasetBuilder():
 
     def _insert_missing_game_play_shares(self, weather_regression_data: dict, hand_combos: list = constants.HAND_COMBOS) -> dict:
         """
-        Fills in missing play types for each game in the input dictionary by adding rows with a 
-        `game_play_share` of 0 for missing play types in each game.
+        Fills in missing play types for each game in the input dictionary, giving each game one row per play 
+        type with a `game_play_share` of 0 for the play types that didn't happen in the game.
 
         Parameters:
             weather_regression_data (dict): A dictionary of DataFrames, each containing plays divided by 
@@ -229,47 +205,31 @@ class DatasetBuilder():
             hand_combos (list): A list of batter-pitcher handedness combinations to iterate over (default is `constants.HAND_COMBOS`).
 
         Returns:
-            dict: The updated dictionary of DataFrames, now with missing play types filled in for each game 
-                with a `game_play_share` of 0.
+            dict: A dictionary of DataFrames with one row for every game and play type in `constants.PLAY_TYPES`, 
+                holding the game's date and weather and the play type's `game_play_share` (0 if missing).
         """
 
         # As the only plays in our data are types that happened in games, fill in all the missing play types for each game with a game_share of 0 for that play type
-        play_types = constants.PLAY_TYPES
-        n = 0
-        for pitbat_combo in constants.HAND_COMBOS:
-            for game in weather_regression_data[pitbat_combo].game_pk.unique():
-                n += 1
-                if self.verbose:
-                    if n % 10000 == 0:
-                        print("Filling in the values for the game_play_share variable for games without the play (0). There are {}K Instances Remaining".format(
-                            round((sum([len(weather_regression_data[x].game_pk.unique()) for x in constants.HAND_COMBOS])-n)/1000), 6))
-                    clear_output(wait=True)
-
-                # Slice all plays to a specific game
-                df = weather_regression_data[pitbat_combo][weather_regression_data[pitbat_combo].game_pk.values == game].copy(
-                )
-                # Check if there are any missing plays and if so, determine how many and which ones
-                if len(df) < len(play_types):
-                    missing_plays = [
-                        play for play in play_types if play not in df.play_type.values]
-                    num_missing_plays = len(missing_plays)
-
-                    # Pull all the game info for easy reference while inserting
-                    game_info = df.iloc[0]
-
-                    # Build and insert into all pitches a DataFrame of each missing play from each game with the basic game info for the weather regression, including a game play share of 0
-                    weather_regression_data[pitbat_combo] = pd.concat([weather_regression_data[pitbat_combo], pd.DataFrame({"game_pk": [game]*num_missing_plays,
-                                                                                                                            "game_date": [game_info.game_date]*num_missing_plays,
-                                                                                                                            "play_type": missing_plays,
-                                                                                                                            "temprature": [game_info.temprature]*num_missing_plays,
-                                                                                                                            "Right to Left": [game_info["Right to Left"]]*num_missing_plays,
-                                                                                                                            "Left to Right": [game_info["Left to Right"]]*num_missing_plays,
-                                                                                                                            "in": [game_info["in"]]*num_missing_plays,
-                                                                                                                            "out": [game_info["out"]]*num_missing_plays,
-                                                                                                                            "zero": [game_info["zero"]]*num_missing_plays,
-                                                                                                                            "game_play_share": [0]*num_missing_plays})])
-
-        return weather_regression_data
+        game_columns = ["game_date", "temprature", "Right to Left", "Left to Right", "in", "out", "zero"]
+        filled_regression_data = {}
+        for pitbat_combo in hand_combos:
+            if self.verbose:
+                print("Filling in the values for the game_play_share variable for games without the play (0). There are {} Pitbat Combos Remaining".format(
+                    len(hand_combos) - hand_combos.index(pitbat_combo)))
+                clear_output(wait=True)
+
+            plays = weather_regression_data[pitbat_combo]
+
+            # The date and weather of each game, and the share of each play type that happened in it
+            game_info = plays.groupby("game_pk")[game_columns].first()
+            game_play_shares = plays.groupby(["game_pk", "play_type"]).game_play_share.last()
+
+            # Build every (game, play type) combination at once and join the observed shares and the game info onto it
+            all_game_plays = pd.MultiIndex.from_product([game_info.index, constants.PLAY_TYPES], names=["game_pk", "play_type"])
+            filled = game_play_shares.reindex(all_game_plays, fill_value=0).reset_index()
+            filled_regression_data[pitbat_combo] = filled.join(game_info, on="game_pk")
+
+        return filled_regression_data
 
     def _create_weather_regression_dataframes(self, all_plays_by_hand_combo):
         """
@@ -597,25 +557,39 @@ class DatasetBuilder():
             df = all_plays_by_hand_combo[pitbat_combo][["game_pk", "game_date", "batter", "pitcher", 'on_3b', 'on_2b', 'on_1b', 'outs_when_up', 'inning',
                                                         'inning_topbot', "bat_score", "fld_score", "play_type", "temprature", "wind_speed", "wind_direction", "ballpark"]].copy()
 
+            # Turn the coefficient dictionaries into small tables, weather coefficients by play type and park factors by ballpark (rows) and play type (columns).
+            # Park factors that couldn't be computed ("n/a", the play type never happened away from the park) are treated as neutral, a factor of 1.0
+            weather_table = pd.DataFrame.from_dict(weather_coefficients[pitbat_combo], orient="index")
+            park_table = pd.DataFrame.from_dict(park_factors_dict[pitbat_combo], orient="index").replace("n/a", 1.0).astype(float)
+
+            # Look up the coefficients of every play at once, by the position of its play type and ballpark in the tables
+            play_rows = weather_table.index.get_indexer(df.play_type)
+            ballpark_rows = park_table.index.get_indexer(df.ballpark)
+            park_columns = park_table.columns.get_indexer(df.play_type)
+            if (play_rows == -1).any() or (ballpark_rows == -1).any() or (park_columns == -1).any():
+                raise KeyError(f"No neutralization coefficients for some plays of the {pitbat_combo} pitbat combo")
+            play_coefficients = weather_table.iloc[play_rows]
+
             # Add information for the actual weather and stadium impacts for each game
             df = _convert_wind_direction(df, df.wind_direction)
-            df["weather_expectation"] = df.apply(lambda x: x["Left to Right"]*weather_coefficients[pitbat_combo][x.play_type]["wind_ltr"] + x["Right to Left"]*weather_coefficients[pitbat_combo][x.play_type]["wind_rtl"] +
-                                                 x["in"]*weather_coefficients[pitbat_combo][x.play_type]["wind_in"] + x["out"]*weather_coefficients[pitbat_combo][x.play_type]["wind_out"] +
-                                                 (x["temprature"]**2) * weather_coefficients[pitbat_combo][x.play_type]["temprature_sq"] + weather_coefficients[pitbat_combo][x.play_type]["intercept"], axis=1)
+            df["weather_expectation"] = (df["Left to Right"].values*play_coefficients["wind_ltr"].values + df["Right to Left"].values*play_coefficients["wind_rtl"].values +
+                                         df["in"].values*play_coefficients["wind_in"].values + df["out"].values*play_coefficients["wind_out"].values +
+                                         (df["temprature"].values**2) * play_coefficients["temprature_sq"].values + play_coefficients["intercept"].values)
 
-            df["neutral_weather_expectation"] = df.apply(lambda x: 72**2 * weather_coefficients[pitbat_combo]
-                                                         [x.play_type]["temprature_sq"] + weather_coefficients[pitbat_combo][x.play_type]["intercept"], axis=1)
+            df["neutral_weather_expectation"] = 72**2 * play_coefficients["temprature_sq"].values + play_coefficients["intercept"].values
             df["weather_impact"] = df.weather_expectation / \
                 df.neutral_weather_expectation
             # If delving further into project, we are technically doubling counting some of the weather impact in the stadium
-            df["stadium_impact"] = df.apply(
-                lambda x: park_factors_dict[pitbat_combo][x.ballpark][x.play_type], axis=1)
+            df["stadium_impact"] = park_table.values[ballpark_rows, park_columns]
 
             # Multiply the weather and stadium impacts to get the total impact for the specific at-bat result
             df["play_value"] = 1
             df["impact"] = df.play_value * \
                 df.weather_impact * df.stadium_impact
             df.play_value = 1/df.impact
+            if df.play_value.isna().any():
+                missing = df.loc[df.play_value.isna(), ["ballpark", "play_type"]].drop_duplicates()
+                raise ValueError(f"No play value for some plays of the {pitbat_combo} pitbat combo, by (ballpark, play_type): {list(missing.itertuples(index=False, name=None))}")
 
             # Grab the final df that we will use for rolling stats
             factored_training_stats[pitbat_combo] = df[["game_pk", "game_date", "ballpark", "temprature", "wind_speed", "wind_direction", "batter", "pitcher",
@@ -996,6 +970,64 @@ class DatasetBuilder():
 
         return league_average_plays_dict
 
+    ############################### BASE RUNNING TABLES  ###############################
+
+    def build_base_running_tables(self, raw_pitches_df: pd.DataFrame) -> dict:
+        """
+        Counts how the base/out state moves on every regular season play, for the simulator's runner advancement odds.
+        The state after a play is the state before the next play of the same half inning (so steals, wild pitches, etc.
+        in between are folded in), and the last play of a half inning ends it with the outs it recorded. Walk offs, and
+        last plays that leave the half inning open (it ended on a caught stealing, pickoff, etc. after the play), are left
+        out since the state they end in isn't known.
+
+        Args:
+            raw_pitches_df (pd.DataFrame): Uncleaned pitch data from the Statcast API.
+
+        Returns:
+            dict: 'outcomes', the play types in code order, and 'counts', an int array indexed
+            [outcome, bases, outs, new bases, new outs (3 = half inning over), runs (capped at 4)] where bases are
+            on_1b + 2*on_2b + 4*on_3b.
+
+        Example:
+            base_running_tables = build_base_running_tables(raw_pitches)
+        """
+
+        if self.verbose:
+            print("Building Base Running Tables")
+
+        # Keep every regular season event in game order, even those we don't model, so the next state is the true one
+        plays = raw_pitches_df[(raw_pitches_df.game_type == "R") & (pd.isna(raw_pitches_df.events) == False)]
+        plays = plays.sort_values(by=["game_pk", "at_bat_number"])
+        bases = (plays.on_1b.notna().astype(int) + 2*plays.on_2b.notna().astype(int) + 4*plays.on_3b.notna().astype(int))
+
+        # Pull the state before the next play of the same half inning
+        half_innings = bases.groupby([plays.game_pk, plays.inning, plays.inning_topbot])
+        next_bases = half_innings.shift(-1)
+        next_outs = plays.outs_when_up.groupby([plays.game_pk, plays.inning, plays.inning_topbot]).shift(-1)
+        ends_half = next_outs.isna()
+
+        # The last play of a half inning has no next state, so its outs are the ones it recorded itself. If that doesn't end
+        # the half inning (it ended on a caught stealing, pickoff, etc. after the play) where the runners ended up isn't known
+        last_outs = plays.outs_when_up + plays.events.map(constants.EVENT_OUTS).fillna(0)
+        new_outs = next_outs.where(~ends_half, last_outs).clip(upper=3)
+        new_bases = next_bases.where(~ends_half, 0)
+        runs = (plays.post_bat_score - plays.bat_score).clip(0, 4)
+
+        # Only count the play types the simulator uses (intentional walks are walks there)
+        outcomes = sorted(set(constants.PLAY_TYPES) - {"intent_walk"})
+        codes = plays.events.map(constants.PLAY_TYPE_DICT).replace("intent_walk", "walk").map(
+            {outcome: code for code, outcome in enumerate(outcomes)})
+        walk_off = ends_half & (plays.inning >= 9) & (plays.inning_topbot == "Bot") & (plays.post_bat_score > plays.fld_score)
+        unknown_end = ends_half & (new_outs < 3)
+        valid = (codes.notna() & ~walk_off & ~unknown_end & plays.outs_when_up.between(0, 2) & (new_outs >= plays.outs_when_up)
+                 & runs.notna())
+
+        counts = np.zeros((len(outcomes), 8, 3, 8, 4, 5), dtype=np.int64)
+        np.add.at(counts, tuple(column[valid].astype(int).values for column in
+                                [codes, bases, plays.outs_when_up, new_bases, new_outs, runs]), 1)
+
+        return {"outcomes": np.array(outcomes), "counts": counts}
+
     ############################### CREATING FINAL DATASETS  ###############################
 
     def _make_final_dataset(self, cleaned_pitches, coef_dicts):
@@ -1026,7 +1058,7 @@ class DatasetBuilder():
         return final_dataset
 
     def build_training_dataset(self, raw_pitches, suffix, save_cleaned=False, save_coefficients=False,
-                               save_dataset=False, online_save=False, local_save=False, model=None):
+                               save_dataset=False, online_save=False, local_save=False, model=None, save_base_running=False):
         """
         Cleans raw pitch data, generates neutralization coefficients, builds a final dataset, and prepares
         a machine-readable training dataset. Optionally saves all intermediate results.
@@ -1040,6 +1072,7 @@ class DatasetBuilder():
             save_training_dataset (bool): Whether to save the training dataset.
             online_save (bool): Whether to save data to the cloud.
             local_save (bool): Whether to save data locally.
+            save_base_running (bool): Whether to build and save the base running tables.
 
         Returns:
             dict: Training dataset dictionary containing features and target values.
@@ -1048,6 +1081,15 @@ class DatasetBuilder():
             training_data = build_training_dataset(raw_pitches, 'model_v1', save_cleaned=True, online_save=True)
         """
 
+        # Count the runner advancement from the raw pitches, before cleaning filters out the plays in between
+        if save_base_running:
+            base_running_tables = self.build_base_running_tables(raw_pitches)
+            if online_save:
+                cf.CloudHelper(obj=base_running_tables).upload_to_cloud(
+                    'simulation_training_data', f"base_running_tables_{suffix}")
+            if local_save:
+                np.savez_compressed(f"data/processed_data/base_running_tables_{suffix}.npz", **base_running_tables)
+
         # Clean raw pitches and return a cleaned pitches DataFrame
         cleaned_data = self.clean_raw_pitches(raw_pitches)
 
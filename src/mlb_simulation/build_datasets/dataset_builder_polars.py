@@ -23,6 +23,7 @@ from datetime import datetime as dt
 
 from multimodal_communication import cloud_functions as cf
 from mlb_simulation.build_datasets import constants
+from mlb_simulation.build_datasets.ballparks import ballpark_years
 from mlb_simulation.build_datasets.utils_polars import (_correct_home_away_swap,
                    _get_wind_direction,
                    _segregate_plays_by_pitbat_combo
@@ -258,15 +259,22 @@ class DatasetBuilder():
 
         ############ ATTATCH BALLPARK INFO TO EACH PITCH ############
 
-        # Import file to help connect team and year with a specific ballpark
+        # Import file to help connect team and year with a specific ballpark, resolved to one stadium per team and year
         ballpark_pandas = pd.read_excel('data/Ballpark Info.xlsx')
-        ballpark_info = pl.from_pandas(ballpark_pandas).lazy()
+        ballpark_info = pl.from_pandas(ballpark_years(ballpark_pandas, max(self.unique_years))).lazy()
 
-        # Join the pitches to the ballparks
-        final_plays = final_plays.join(ballpark_info, on='home_team', how='left')
-        final_plays = final_plays.filter(
-            pl.col('game_date').str.split('-').list.get(0).cast(pl.Int64) < pl.col('End Date').cast(pl.Int64)
-        ).drop('Start Date', 'End Date', 'Full Name')
+        final_plays = final_plays.with_columns(
+            pl.col('game_date').str.slice(0, 4).cast(pl.Int64).alias('year')
+        )
+
+        # Every team and year has to have a stadium, like resolve_ballparks requires in the pandas builder
+        missing_ballparks = (final_plays.select('home_team', 'year').unique()
+                             .join(ballpark_info, on=['home_team', 'year'], how='anti').sort('home_team', 'year').collect())
+        if missing_ballparks.height:
+            raise ValueError(f"No ballpark for (home_team, year): {missing_ballparks.rows()}")
+
+        # Join the pitches to the ballparks, which matches each pitch to exactly one stadium
+        final_plays = final_plays.join(ballpark_info, on=['home_team', 'year'], how='left', validate='m:1').drop('year')
 
         ############ Divide pitches by pitbat combos in 4 dataframes ############
         all_plays_by_pitbat_combo = {}
@@ -1,5 +1,8 @@
 import pandas as pd
 
+# Weather string used for plays whose game has no weather
+DOME_WEATHER = 'Start Time Weather: 72° F, Wind 0mph, In Dome.'
+
 def _get_wind_direction(full_weather: str) -> str:
     """
     Extracts the wind direction from a full weather description scraped from a baseball 
@@ -68,7 +71,34 @@ def _pull_full_weather(game_date, home_team, away_team, total_weather_df):
             total_weather_df.converted_home_team.values == away_team))].weather.iloc[0]
         return value
     except:
-        return 'Start Time Weather: 72° F, Wind 0mph, In Dome.'
+        return DOME_WEATHER
+
+def _join_full_weather(plays: pd.DataFrame, total_weather_df: pd.DataFrame) -> tuple:
+    """
+    Looks up the raw weather string of every play with a keyed join on (date, team) instead of scanning the weather for
+    each play. A play takes the weather of its date's game at its home team's park, or failing that at its away team's
+    park (for the few games where the pitch data has teams that were both on the road). Plays with neither get the
+    standard dome weather.
+
+    Parameters:
+        plays (DataFrame): Plays with game_date, home_team, away_team and game_pk columns.
+        total_weather_df (DataFrame): Weather rows with date, converted_home_team and weather columns.
+
+    Returns:
+        tuple: A Series of weather strings aligned with plays, and the number of games that had no weather.
+    """
+    # The first weather row of each (date, home team) wins, like the row by row lookup
+    weather = total_weather_df.drop_duplicates(["date", "converted_home_team"]).set_index(["date", "converted_home_team"]).weather
+
+    full_weather = pd.Series(weather.reindex(pd.MultiIndex.from_arrays([plays.game_date, plays.home_team])).values, index=plays.index)
+    missing = full_weather.isna().values
+    full_weather[missing] = weather.reindex(pd.MultiIndex.from_arrays([plays.game_date[missing], plays.away_team[missing]])).values
+
+    missing = full_weather.isna().values
+    unmatched_games = plays.game_pk[missing].nunique()
+    full_weather[missing] = DOME_WEATHER
+
+    return full_weather, unmatched_games
 
 def _segregate_plays_by_pitbat_combo(cleaned_plays: pd.DataFrame) -> pd.DataFrame:
     """
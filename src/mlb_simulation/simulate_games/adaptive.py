@@ -0,0 +1,88 @@
+import pandas as pd
+import numpy as np
+from statistics import NormalDist
+
+from simulate import BATTER_STATS, PITCHER_STATS, HOME, AWAY
+
+
+class Target():
+    '''A quantity to estimate from the simulated games. values(game, batter_box, pitcher_box, scores) turns a batch of
+    simulate_games_arrays output into one value per game, and the target is met once the confidence interval half width
+    of their mean is at most precision. binary targets (0/1 values, so their mean is a chance) use a Wilson interval,
+    which unlike the normal one doesn't shrink to nothing while every game has the same value (e.g. a threshold no game
+    has hit yet)'''
+    def __init__(self, name, values, precision, binary=False):
+        self.name = name
+        self.values = values
+        self.precision = precision
+        self.binary = binary
+
+
+class _RunningMean():
+    def __init__(self, binary=False):
+        self.binary = binary
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+
+    def update(self, values):
+        # Chan's combination of the running mean/variance with the batch's
+        n_batch = len(values)
+        batch_mean = values.mean()
+        n = self.n + n_batch
+        delta = batch_mean - self.mean
+        self.mean += delta * n_batch / n
+        self.M2 += ((values - batch_mean) ** 2).sum() + delta ** 2 * self.n * n_batch / n
+        self.n = n
+
+    def half_width(self, z):
+        if self.n < 2:
+            return np.inf
+        if self.binary:
+            # Wilson score interval
+            return z / (1 + z**2 / self.n) * np.sqrt(self.mean * (1 - self.mean) / self.n + z**2 / (4 * self.n**2))
+        return z * np.sqrt(self.M2 / (self.n - 1) / self.n)
+
+
+def home_win_probability(precision=0.01):
+    return Target('home_win_probability', lambda game, batter_box, pitcher_box, scores: (scores[:, HOME] > scores[:, AWAY]).astype(float),
+                  precision, binary=True)
+
+
+def total_runs(precision=0.1):
+    return Target('total_runs', lambda game, batter_box, pitcher_box, scores: scores.sum(axis=1).astype(float), precision)
+
+
+def player_stat_over(player_id, stat, threshold, precision=0.01, pitcher=False):
+    # The chance a player's stat ends the game above threshold (e.g. strikeouts over 5.5)
+    def values(game, batter_box, pitcher_box, scores):
+        if pitcher:
+            box, row, column = pitcher_box, game._pitcher_box_template.index.get_loc(float(player_id)), (PITCHER_STATS + ['total_bases_allowed']).index(stat)
+        else:
+            box, row, column = batter_box, game._batter_box_template.index.get_loc(float(player_id)), (BATTER_STATS + ['total_bases']).index(stat)
+        return (box[:, row, column] > threshold).astype(float)
+    return Target(f'{player_id}_{stat}_over_{threshold}', values, precision, binary=True)
+
+
+def simulate_until_converged(game, targets, batch_size=1000, min_sims=1000, max_sims=100000, confidence=0.95, aggregator=None):
+    '''Runs game.simulate_games_arrays batch_size games at a time until every target's confidence interval half width is
+    within its precision (after at least min_sims games) or max_sims games have been run. The batches are also fed to
+    aggregator when one is given.
+    Returns a DataFrame with each target's estimate, achieved half width, requested precision and whether it converged'''
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    estimates = [_RunningMean(target.binary) for target in targets]
+    n_sims = 0
+    while n_sims < max_sims:
+        batter_box, pitcher_box, scores = game.simulate_games_arrays(min(batch_size, max_sims - n_sims))
+        n_sims += len(scores)
+        for target, estimate in zip(targets, estimates):
+            estimate.update(target.values(game, batter_box, pitcher_box, scores))
+        if aggregator is not None:
+            aggregator.update_batch(batter_box, pitcher_box, scores)
+
+        if n_sims >= min_sims and all(estimate.half_width(z) <= target.precision for target, estimate in zip(targets, estimates)):
+            break
+
+    return pd.DataFrame([{'target': target.name, 'estimate': estimate.mean, 'half_width': estimate.half_width(z),
+                          'precision': target.precision, 'converged': estimate.half_width(z) <= target.precision, 'n_sims': estimate.n}
+                         for target, estimate in zip(targets, estimates)]).set_index('target')
@@ -0,0 +1,109 @@
+import pandas as pd
+import numpy as np
+
+
+class StatAggregator():
+    '''Online statistics for a fixed (entity, stat) grid of non negative integer stats, fed one batch of sims at a time.
+    Keeps the running mean/variance (Welford, combined per batch with Chan's formula) and a count histogram per
+    entity/stat. The histogram doubles as an exact quantile sketch, with values of max_value or more sharing the last bin.
+    Memory only depends on the grid and max_value, and two aggregators of the same grid merge by adding them up'''
+    def __init__(self, n_entities, n_stats, max_value=40):
+        self.n_entities, self.n_stats, self.max_value = n_entities, n_stats, max_value
+        self.n = 0
+        self.mean = np.zeros((n_entities, n_stats))
+        self.M2 = np.zeros((n_entities, n_stats))
+        self.counts = np.zeros((n_entities, n_stats, max_value + 1), dtype=np.int64)
+
+    def update(self, values):
+        # values is (n_sims, n_entities, n_stats)
+        values = np.asarray(values)
+        n_batch = len(values)
+        if n_batch == 0:
+            return self
+        batch_mean = values.mean(axis=0)
+        batch_M2 = ((values - batch_mean) ** 2).sum(axis=0)
+        self._combine(n_batch, batch_mean, batch_M2)
+
+        # Count every value into its (entity, stat) histogram with one bincount over the flattened bin indexes
+        bins = np.clip(values, 0, self.max_value) + self.counts.shape[2] * np.arange(self.n_entities * self.n_stats).reshape(self.n_entities, self.n_stats)
+        self.counts += np.bincount(bins.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    def merge(self, other):
+        if (other.n_entities, other.n_stats, other.max_value) != (self.n_entities, self.n_stats, self.max_value):
+            raise ValueError('Can only merge aggregators of the same shape')
+        if other.n > 0:
+            self._combine(other.n, other.mean, other.M2)
+            self.counts += other.counts
+        return self
+
+    def _combine(self, n_other, mean_other, M2_other):
+        n = self.n + n_other
+        delta = mean_other - self.mean
+        self.mean = self.mean + delta * n_other / n
+        self.M2 = self.M2 + M2_other + delta ** 2 * self.n * n_other / n
+        self.n = n
+
+    @property
+    def variance(self):
+        # Sample variance
+        return self.M2 / (self.n - 1) if self.n > 1 else np.full_like(self.M2, np.nan)
+
+    def quantile(self, q):
+        # Smallest value whose cumulative share reaches q, for every entity/stat
+        cumulative = self.counts.cumsum(axis=2)
+        return (cumulative < q * self.n).sum(axis=2).clip(max=self.max_value)
+
+
+class BoxScoreAggregator():
+    '''Aggregates simulated games of one matchup without keeping the box scores around. Holds a StatAggregator for the
+    batters, the pitchers and the final scores (home, away). The *_labels frames are the non stat columns of the box
+    score DataFrames, in the same row order as the arrays fed to update_batch'''
+    def __init__(self, batter_labels, batter_stats, pitcher_labels, pitcher_stats, max_value=40):
+        self.batter_labels, self.batter_stats = batter_labels, list(batter_stats)
+        self.pitcher_labels, self.pitcher_stats = pitcher_labels, list(pitcher_stats)
+        self.batters = StatAggregator(len(batter_labels), len(self.batter_stats), max_value)
+        self.pitchers = StatAggregator(len(pitcher_labels), len(self.pitcher_stats), max_value)
+        self.scores = StatAggregator(1, 2, max_value)
+
+    @property
+    def n(self):
+        return self.scores.n
+
+    def update_batch(self, batter_box, pitcher_box, scores):
+        # batter_box is (n_sims, n_batters, n_batter_stats), pitcher_box (n_sims, n_pitchers, n_pitcher_stats), scores (n_sims, 2)
+        self.batters.update(batter_box)
+        self.pitchers.update(pitcher_box)
+        self.scores.update(np.asarray(scores).reshape(-1, 1, 2))
+        return self
+
+    def update(self, batter_box_score, pitcher_box_score, score_tracker):
+        # Feeds one simulate_game result
+        return self.update_batch(batter_box_score[self.batter_stats].values[None], pitcher_box_score[self.pitcher_stats].values[None],
+                                 [[score_tracker['home'], score_tracker['away']]])
+
+    def merge(self, other):
+        self.batters.merge(other.batters)
+        self.pitchers.merge(other.pitchers)
+        self.scores.merge(other.scores)
+        return self
+
+    def _summarize(self, aggregator, labels, stats, quantiles):
+        # One row per (entity, stat) with its mean, std and quantiles
+        summary = {'mean': aggregator.mean.ravel(), 'std': np.sqrt(aggregator.variance).ravel()}
+        for q in quantiles:
+            summary[f'q{int(round(q * 100))}'] = aggregator.quantile(q).ravel()
+        index = pd.MultiIndex.from_product([labels.index, stats], names=[labels.index.name, 'stat'])
+        summary = pd.DataFrame(summary, index=index).reset_index(level='stat')
+        return labels.join(summary).reset_index()
+
+    def summary(self, quantiles=(0.1, 0.5, 0.9)):
+        return {'batters': self._summarize(self.batters, self.batter_labels, self.batter_stats, quantiles),
+                'pitchers': self._summarize(self.pitchers, self.pitcher_labels, self.pitcher_stats, quantiles),
+                'scores': self._summarize(self.scores, pd.DataFrame(index=pd.Index(['game'], name='game')), ['home', 'away'], quantiles)}
+
+    def distribution(self, player_id, stat, pitcher=False):
+        # The count histogram of one player's stat as a Series of value -> share of sims
+        aggregator, labels, stats = (self.pitchers, self.pitcher_labels, self.pitcher_stats) if pitcher else (self.batters, self.batter_labels, self.batter_stats)
+        counts = aggregator.counts[labels.index.get_loc(player_id), stats.index(stat)]
+        return pd.Series(counts / max(aggregator.n, 1), name=stat).rename_axis('value')
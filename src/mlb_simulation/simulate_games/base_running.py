@@ -0,0 +1,221 @@
+import numpy as np
+
+
+# Chances used by the runner rules
+ERROR_IS_DOUBLE = 0.25 # 2 base error, otherwise a 1 base error
+SINGLE_2B_SCORES = 0.62
+SINGLE_1B_SCORES = 0.01
+SINGLE_1B_TO_3B = 0.40 # Can only advance if 2nd scores
+DOUBLE_1B_SCORES = 0.38
+
+# Runs on these plays don't count as rbis in the empirical tables
+NO_RBI_OUTCOMES = ['error', 'double_play']
+
+
+class _ScriptedChances():
+    # Answers the coin flips of a play from a fixed script of results, recording the probability of the path taken.
+    # Asking past the end of the script raises, which is how the enumeration below finds the next flip to branch on
+    def __init__(self, script):
+        self.script = script
+        self.flips = 0
+        self.probability = 1.0
+
+    def __call__(self, p):
+        if self.flips == len(self.script):
+            raise IndexError
+        result = self.script[self.flips]
+        self.flips += 1
+        self.probability *= p if result else 1 - p
+        return result
+
+
+def _play(outcome, on_1b, on_2b, on_3b, outs, chance):
+    '''The runner rules for one play, written against chance(p), which returns True with probability p.
+    Returns the new (on_1b, on_2b, on_3b, outs, runs, rbis)'''
+    runs, rbis = 0, 0
+
+    def base_hit(bases):
+        # The batter is placed on base before the runners move, so he moves along (and can score) with them
+        nonlocal on_1b, on_2b, on_3b, runs, rbis
+        if bases == 1:
+            on_1b = 1
+            if on_3b:
+                runs, rbis, on_3b = runs + 1, rbis + 1, 0
+            runner_on_2b_scores = on_2b and chance(SINGLE_2B_SCORES)
+            runner_on_1b_scores = on_1b and chance(SINGLE_1B_SCORES)
+            runner_on_1b_advances = on_1b and runner_on_2b_scores and chance(SINGLE_1B_TO_3B)
+            if runner_on_2b_scores:
+                runs, rbis, on_2b = runs + 1, rbis + 1, 0
+            if runner_on_1b_scores:
+                runs, rbis, on_1b = runs + 1, rbis + 1, 0
+            elif runner_on_1b_advances:
+                on_3b, on_1b = on_1b, 0
+            else:
+                on_2b = on_1b
+            on_1b = 1
+        elif bases == 2:
+            on_2b = 1
+            if on_3b:
+                runs, rbis, on_3b = runs + 1, rbis + 1, 0
+            if on_2b:
+                runs, rbis, on_2b = runs + 1, rbis + 1, 0
+            if on_1b and chance(DOUBLE_1B_SCORES):
+                runs, rbis, on_1b = runs + 1, rbis + 1, 0
+            else:
+                on_3b = on_1b
+            on_2b, on_1b = 1, 0
+        else:
+            on_3b = 1
+            scored = on_3b + on_2b + on_1b
+            runs, rbis = runs + scored, rbis + scored
+            on_3b, on_2b, on_1b = 1, 0, 0
+
+    if outcome in ('strikeout', 'field_out'):
+        outs += 1
+    elif outcome == 'walk':
+        # Runners are never forced along (the walk branch compares instead of assigning), a run only scores with the bases loaded
+        if on_1b and on_2b and on_3b:
+            runs += 1
+    elif outcome == 'single':
+        base_hit(1)
+    elif outcome == 'double':
+        base_hit(2)
+    elif outcome == 'triple':
+        base_hit(3)
+    elif outcome == 'home_run':
+        runs += on_1b + on_2b + on_3b + 1
+        rbis += 1
+        on_1b, on_2b, on_3b = 0, 0, 0
+    elif outcome == 'error':
+        base_hit(2 if chance(ERROR_IS_DOUBLE) else 1)
+    elif outcome == 'double_play':
+        outs += 2
+        if on_1b and on_2b:
+            on_1b, on_2b = 0, 0
+        elif on_2b and on_3b:
+            on_2b, on_3b = 0, 0
+        elif on_1b and on_3b:
+            on_1b = 0
+            if outs < 3: # Then the runner on 3b can score
+                runs, on_3b = runs + 1, 0
+        elif on_3b:
+            on_3b = 0
+        elif on_2b:
+            on_2b = 0
+        elif on_1b:
+            on_1b = 0
+    elif outcome == 'sacrifice':
+        outs += 1
+        if on_3b:
+            runs, on_3b = runs + 1, 0
+        if on_2b:
+            on_2b, on_3b = 0, 1
+        if on_1b:
+            on_1b, on_2b = 0, 1
+    elif outcome == 'fielders_choice':
+        outs += 1
+        if on_3b:
+            on_3b = 0
+            if on_2b:
+                on_2b, on_3b = 0, 1
+            if on_1b:
+                on_1b, on_2b = 0, 1
+        elif on_2b:
+            on_2b, on_3b = 0, 1
+            if on_1b:
+                on_1b, on_2b = 0, 1
+        on_1b = 1
+
+    return on_1b, on_2b, on_3b, outs, runs, rbis
+
+
+def _play_branches(outcome, on_1b, on_2b, on_3b, outs):
+    # Walks every combination of coin flips the play can ask for, merging the paths that end up in the same place
+    branches = {}
+    scripts = [[]]
+    while scripts:
+        script = scripts.pop()
+        chance = _ScriptedChances(script)
+        try:
+            result = _play(outcome, on_1b, on_2b, on_3b, outs, chance)
+        except IndexError:
+            scripts += [script + [True], script + [False]]
+            continue
+        if chance.probability > 0:
+            branches[result] = branches.get(result, 0) + chance.probability
+    return branches
+
+
+def base_running_transitions(outcome_names):
+    '''Enumerates the runner rules into a table: transitions[outcome code][bases][outs] is a list of
+    (probability, new bases, new outs, runs, rbis) entries, one per distinct result. Bases are on_1b + 2*on_2b + 4*on_3b,
+    new outs can be 3 or more when the play ends the half inning (runs on that play still count)'''
+    transitions = []
+    for outcome in outcome_names:
+        by_bases = []
+        for bases in range(8):
+            on_1b, on_2b, on_3b = bases % 2, bases // 2 % 2, bases // 4
+            by_outs = []
+            for outs in range(3):
+                entries = [(probability, new_1b + 2*new_2b + 4*new_3b, new_outs, runs, rbis)
+                           for (new_1b, new_2b, new_3b, new_outs, runs, rbis), probability
+                           in _play_branches(outcome, on_1b, on_2b, on_3b, outs).items()]
+                by_outs.append(sorted(entries, key=lambda entry: -entry[0]))
+            by_bases.append(by_outs)
+        transitions.append(by_bases)
+    return transitions
+
+
+def load_base_running_transitions(path, outcome_names, fallback, min_count=25):
+    '''Turns the counts saved by DatasetBuilder.build_base_running_tables into a base_running_transitions table for
+    outcome_names. Each (outcome, bases, outs) with at least min_count plays gets its observed results as entries (the
+    bases are emptied once the half inning is over), everything else keeps its entries from fallback'''
+    tables = np.load(path)
+    table_outcomes = list(tables['outcomes'])
+    counts = tables['counts']
+
+    transitions = [[[list(entries) for entries in by_outs] for by_outs in by_bases] for by_bases in fallback]
+    for code, outcome in enumerate(outcome_names):
+        if outcome not in table_outcomes:
+            continue
+        for bases in range(8):
+            for outs in range(3):
+                state_counts = counts[table_outcomes.index(outcome), bases, outs]
+                total = state_counts.sum()
+                if total < min_count:
+                    continue
+                entries = [(float(state_counts[new_bases, new_outs, runs] / total), int(new_bases) if new_outs < 3 else 0, int(new_outs), int(runs),
+                            0 if outcome in NO_RBI_OUTCOMES else int(runs))
+                           for new_bases, new_outs, runs in np.argwhere(state_counts)]
+                transitions[code][bases][outs] = sorted(entries, key=lambda entry: -entry[0])
+    return transitions
+
+
+def base_running_arrays(transitions):
+    '''Pads the base_running_transitions table into dense arrays indexed [outcome code, bases, outs, entry] for the batched
+    engine. 'cumulative' holds the running entry probabilities (the last real entry is exactly 1 and so is the padding),
+    so the entry for a uniform u is the number of cumulative values at or below u, same as pick_entry'''
+    n_entries = max(len(entries) for by_bases in transitions for by_outs in by_bases for entries in by_outs)
+    shape = (len(transitions), 8, 3, n_entries)
+    arrays = {'cumulative': np.ones(shape), 'bases': np.zeros(shape, dtype=int), 'outs': np.zeros(shape, dtype=int),
+              'runs': np.zeros(shape, dtype=int), 'rbis': np.zeros(shape, dtype=int)}
+    for code, by_bases in enumerate(transitions):
+        for bases, by_outs in enumerate(by_bases):
+            for outs, entries in enumerate(by_outs):
+                for i, (probability, new_bases, new_outs, runs, rbis) in enumerate(entries):
+                    arrays['bases'][code, bases, outs, i] = new_bases
+                    arrays['outs'][code, bases, outs, i] = new_outs
+                    arrays['runs'][code, bases, outs, i] = runs
+                    arrays['rbis'][code, bases, outs, i] = rbis
+                arrays['cumulative'][code, bases, outs, :len(entries) - 1] = np.cumsum([entry[0] for entry in entries])[:-1]
+    return arrays
+
+
+def pick_entry(entries, u):
+    # The entry of a base_running_transitions list that the uniform u lands in
+    cumulative = 0
+    for entry in entries[:-1]:
+        cumulative += entry[0]
+        if u < cumulative:
+            return entry
+    return entries[-1]
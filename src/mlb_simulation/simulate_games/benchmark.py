@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import platform
+import tracemalloc
+import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+from time import perf_counter
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import OrdinalEncoder
+
+import build_datasets.constants as constants
+from train_models.utils import ml_pipe
+from simulate import GameSimulation, BATTER_STATS
+from sampling import OutcomeSampler
+from daily_context import DailyContext
+from broker import simulate_games_concurrently
+
+
+# Benchmarks the simulation engines on synthetic data, so they can be run anywhere without the MLB-Data pickles or a saved
+# model. Results are written to RESULTS_PATH and compared against the committed BASELINE_PATH, next to this module (run with
+# --write-baseline to replace it)
+RESULTS_PATH = 'benchmark_results.json'
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+ROLLING_WINDOWS = [20, 45, 75, 504]
+BENCHMARK_DATE = datetime.datetime(2025, 6, 1)
+
+# Rough league wide shares of each of constants.PLAY_TYPES, the centre of the synthetic players' rolling shares
+LEAGUE_SHARES = {'strikeout': .225, 'field_out': .37, 'double': .045, 'fielders_choice': .02, 'error': .01, 'walk': .085,
+                 'home_run': .03, 'single': .14, 'sacrifice': .01, 'double_play': .02, 'intent_walk': .005, 'triple': .005}
+
+# Settings of a benchmark run. Results are only compared against a baseline recorded with the same settings
+SETTINGS = {'n_games': 4, 'n_rows': 5000, 'innings_to_simulate': 9, 'scalar_games': 20, 'batch_games': 500,
+            'aggregate_games': 2000, 'concurrent_games': 200, 'repeat': 5, 'seed': 0}
+
+# How far a metric can move against the baseline before it is flagged: rates can drop and times/memory can grow by this fraction
+TOLERANCE = 0.2
+
+
+######################################################################################
+# Synthetic fixtures
+######################################################################################
+def synthetic_teams(n_games):
+    # Home and away team of each game, named so no team name is contained in another (DailyContext.weather matches on it)
+    return [(f'Home Team {chr(65 + i)}', f'Away Team {chr(65 + i)}') for i in range(n_games)]
+
+
+def synthetic_daily_stats(teams, n_rows=5000, rolling_windows=ROLLING_WINDOWS, seed=0):
+    '''A daily_stats_df laid out like the nightly one: ballpark, batter, pitcher, pitbat, the game state columns, every
+    rolling window x play type for batters then pitchers, the weather columns, the league average (LA) columns and the
+    play_type/is_on_base labels. Every player has fixed rolling shares (drawn around LEAGUE_SHARES), so the last row of a
+    player, which is what DailyContext uses, has the same stats as any other. Players are 9 batters (ids 600000 + 100 * team
+    + slot) and one starter (600000 + 100 * team + 50) per team, every team playing in its own home team's park'''
+    rng = np.random.default_rng(seed)
+    play_types = constants.PLAY_TYPES
+    league = np.array([LEAGUE_SHARES[play] for play in play_types])
+    team_names = [team for game in teams for team in game]
+    parks = {team: f'{home} Park' for home, away in teams for team in (home, away)}
+
+    batters = np.array([600000 + 100 * team + slot for team in range(len(team_names)) for slot in range(1, 10)], dtype=float)
+    pitchers = np.array([600000 + 100 * team + 50 for team in range(len(team_names))], dtype=float)
+    batter_hands = rng.choice(['R', 'L'], len(batters), p=[.6, .4])
+    pitcher_hands = rng.choice(['R', 'L'], len(pitchers), p=[.7, .3])
+
+    # Shares per (player, window, play type): longer windows are closer to the player's true shares
+    def player_shares(n_players):
+        true_shares = rng.dirichlet(league * 400, n_players)
+        return np.stack([np.array([rng.dirichlet(shares * window) for shares in true_shares]) for window in rolling_windows], axis=1)
+    batter_shares, pitcher_shares = player_shares(len(batters)), player_shares(len(pitchers))
+
+    batter_rows = rng.integers(0, len(batters), n_rows)
+    pitcher_rows = rng.integers(0, len(pitchers), n_rows)
+    columns = {'ballpark': np.array([parks[team_names[int(batters[row] - 600000) // 100]] for row in batter_rows], dtype=object),
+               'batter': batters[batter_rows],
+               'pitcher': pitchers[pitcher_rows],
+               'pitbat': (pd.Series(batter_hands[batter_rows]) + pitcher_hands[pitcher_rows]).to_numpy(dtype=object),
+               'on_3b': (rng.random(n_rows) < .1).astype(int),
+               'on_2b': (rng.random(n_rows) < .2).astype(int),
+               'on_1b': (rng.random(n_rows) < .3).astype(int),
+               'outs_when_up': rng.integers(0, 3, n_rows),
+               'inning': rng.integers(1, 10, n_rows),
+               'inning_topbot': rng.integers(0, 2, n_rows),
+               'bat_score': rng.poisson(2, n_rows),
+               'fld_score': rng.poisson(2, n_rows)}
+    for prefix, shares, rows in [('', batter_shares, batter_rows), ('pitcher_', pitcher_shares, pitcher_rows)]:
+        for w, window in enumerate(rolling_windows):
+            for p, play in enumerate(play_types):
+                columns[f'{prefix}{window}_PA_{play}'] = shares[rows, w, p]
+
+    # Weather as in the converted rotowire weather: wind speed in the blowing direction's column and temprature squared
+    wind = rng.integers(0, 5, n_rows)
+    wind_speed = rng.integers(0, 20, n_rows)
+    for i, direction in enumerate(['Left to Right', 'Right to Left', 'in', 'out', 'zero']):
+        columns[direction] = np.where(wind == i, wind_speed, 0)
+    columns['temprature_sq'] = rng.normal(72, 10, n_rows) ** 2
+
+    # The league averages are the same on every row of a day
+    for play in play_types:
+        for window in rolling_windows:
+            columns[f'{play}_LA_{window}_PA_{play}'] = np.full(n_rows, rng.dirichlet(league * window * 50)[play_types.index(play)])
+
+    # Labels drawn from each row's batter shares, with intent walks counted as walks like the trained models' labels
+    labels = np.array(play_types, dtype=object)[(batter_shares[batter_rows, -1].cumsum(axis=1) < rng.random((n_rows, 1))).sum(axis=1).clip(max=len(play_types) - 1)]
+    columns['play_type'] = np.where(labels == 'intent_walk', 'walk', labels)
+    columns['is_on_base'] = np.isin(columns['play_type'], ['single', 'double', 'triple', 'home_run', 'walk', 'error']).astype(int)
+    return pd.DataFrame(columns)
+
+
+def synthetic_weather(teams, date=BENCHMARK_DATE):
+    # Rotowire style expected weather, one dome game per home team (every field is a one element list, like the scraped rows)
+    return pd.DataFrame({'game_id': [f'{date:%Y-%m-%d} {away} @ {home} on {date:%B %d}' for home, away in teams],
+                         'wind_direction': [['Out'] for _ in teams], 'is_dome': [[True] for _ in teams],
+                         'rain_percentage': [[0] for _ in teams], 'temprature': [[72] for _ in teams], 'wind_speed': [[0] for _ in teams]})
+
+
+def synthetic_name_conversions(teams):
+    # The Ballpark Info sheet rows for every team
+    return pd.DataFrame({'Stadium': [f'{home} Park' for home, away in teams for _ in range(2)],
+                         'Team': [team.split()[0][:3].upper() for game in teams for team in game],
+                         'Start Date': 1900, 'End Date': 2100,
+                         'Full Name': [team for game in teams for team in game]})
+
+
+def synthetic_lineups(teams):
+    # mlb_scrape style lineup dicts for the synthetic players of synthetic_daily_stats
+    lineups = []
+    for game, (home, away) in enumerate(teams):
+        home_id, away_id = 600000 + 200 * game, 600000 + 200 * game + 100
+        lineups.append({'home_team': home, 'away_team': away,
+                        'home_lineup': {slot: {'player': f'{home} {slot}', 'id': str(home_id + slot)} for slot in range(1, 10)},
+                        'away_lineup': {slot: {'player': f'{away} {slot}', 'id': str(away_id + slot)} for slot in range(1, 10)},
+                        'home_pitcher': {'name': f'{home} SP', 'id': str(home_id + 50)},
+                        'away_pitcher': {'name': f'{away} SP', 'id': str(away_id + 50)}})
+    return lineups
+
+
+def synthetic_model(daily_stats, seed=0):
+    '''A small logistic regression PA model fitted on the synthetic stats with the same ml_pipe as the real ones, plus the
+    play_type encoder. The categorical columns are kept as object columns, like the training datasets'''
+    features = daily_stats.drop(columns=['play_type', 'is_on_base']).astype({'ballpark': object, 'pitbat': object})
+    model = ml_pipe(LogisticRegression(max_iter=200, random_state=seed)).fit(features, daily_stats.play_type)
+    encoder = OrdinalEncoder().fit(daily_stats[['play_type']])
+    return model, encoder
+
+
+def synthetic_fixtures(n_games=4, n_rows=5000, seed=0):
+    '''Everything a benchmark needs: the DailyContext frames, the lineups and a fitted model/encoder'''
+    teams = synthetic_teams(n_games)
+    daily_stats = synthetic_daily_stats(teams, n_rows, seed=seed)
+    model, encoder = synthetic_model(daily_stats, seed)
+    return {'daily_stats': daily_stats, 'expected_weather': synthetic_weather(teams), 'name_conversions': synthetic_name_conversions(teams),
+            'lineups': synthetic_lineups(teams), 'model': model, 'encoder': encoder}
+
+
+######################################################################################
+# Benchmarks
+######################################################################################
+def _best_time(run, repeat):
+    # Fastest of repeat runs (the least disturbed by the rest of the machine) and the last run's result
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = run()
+        times.append(perf_counter() - start)
+    return min(times), result
+
+
+def _peak_memory(run):
+    # Peak traced allocation (numpy's included) of one run, measured on its own since tracing slows everything down
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _plate_appearances(batter_box):
+    # PAs in box score arrays shaped (..., batters, stats) or in a list of simulate_game results
+    if isinstance(batter_box, list):
+        return int(sum(result[0].PAs.sum() for result in batter_box))
+    return int(batter_box[..., BATTER_STATS.index('PAs')].sum())
+
+
+def benchmark_engine(run, n_games, plate_appearances, repeat=3, memory=True):
+    '''Times run() (best of repeat) and returns its rates: plate_appearances is a function of run's result'''
+    seconds, result = _best_time(run, repeat)
+    n_plate_appearances = plate_appearances(result)
+    return {'seconds': seconds, 'games': n_games, 'plate_appearances': n_plate_appearances,
+            'games_per_second': n_games / seconds, 'plate_appearances_per_second': n_plate_appearances / seconds,
+            'peak_memory_bytes': _peak_memory(run) if memory else None}
+
+
+def run_benchmarks(settings=SETTINGS, memory=True):
+    '''Runs every engine on the synthetic fixtures and returns the results: startup times (context, games, compiling the
+    outcome probabilities) and each engine's rates and peak memory'''
+    fixtures = synthetic_fixtures(settings['n_games'], settings['n_rows'], settings['seed'])
+    model, encoder, lineups = fixtures['model'], fixtures['encoder'], fixtures['lineups']
+    repeat, seed, innings = settings['repeat'], settings['seed'], settings['innings_to_simulate']
+
+    def make_context():
+        return DailyContext(BENCHMARK_DATE, fixtures['daily_stats'], fixtures['expected_weather'], fixtures['name_conversions'])
+    context_seconds, context = _best_time(make_context, repeat)
+
+    def make_games(**kwargs):
+        return [GameSimulation(BENCHMARK_DATE, lineup['home_team'], lineup, model, encoder, innings_to_simulate=innings, rng=seed,
+                               context=context, instrumentation=False, **kwargs) for lineup in lineups]
+    games_seconds, games = _best_time(make_games, repeat)
+    compiled = make_games()
+    compile_seconds = _best_time(lambda: [game.compile_outcome_probabilities() for game in compiled], repeat)[0]
+    game, compiled_game = games[0], compiled[0]
+    rolling_game = make_games(update_rolling_stats=True)[0]
+
+    # Every run restarts its game's stream, so each repeat plays the same games
+    def scalar(game):
+        game.sampler = OutcomeSampler(seed)
+        return [game.simulate_game() for _ in range(settings['scalar_games'])]
+
+    def batch(game, n_games):
+        game.sampler = OutcomeSampler(seed)
+        return game.simulate_games_arrays(n_games)
+
+    def aggregate():
+        compiled_game.sampler = OutcomeSampler(seed)
+        return compiled_game.aggregate_games(settings['aggregate_games'])
+
+    def concurrent():
+        for each in games:
+            each.sampler = OutcomeSampler(seed)
+        return simulate_games_concurrently(games, settings['concurrent_games'], arrays=True)[0]
+
+    engines = {'scalar': (lambda: scalar(game), settings['scalar_games'], _plate_appearances),
+               'scalar_compiled': (lambda: scalar(compiled_game), settings['scalar_games'], _plate_appearances),
+               'batch': (lambda: batch(game, settings['batch_games']), settings['batch_games'], lambda result: _plate_appearances(result[0])),
+               'batch_compiled': (lambda: batch(compiled_game, settings['batch_games']), settings['batch_games'],
+                                  lambda result: _plate_appearances(result[0])),
+               'batch_rolling': (lambda: batch(rolling_game, settings['batch_games']), settings['batch_games'],
+                                 lambda result: _plate_appearances(result[0])),
+               'aggregate_compiled': (aggregate, settings['aggregate_games'],
+                                      lambda aggregator: int(round(aggregator.batters.mean[:, BATTER_STATS.index('PAs')].sum() * aggregator.n))),
+               'concurrent': (concurrent, settings['concurrent_games'] * len(games),
+                              lambda results: sum(_plate_appearances(result[0]) for result in results))}
+
+    results = {'settings': dict(settings),
+               'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                               'scikit-learn': sklearn.__version__, 'machine': platform.machine(), 'processor': platform.processor()},
+               'startup': {'context_seconds': context_seconds, 'game_seconds': games_seconds / len(games),
+                           'compile_seconds': compile_seconds / len(compiled)},
+               'engines': {}}
+    for name, (run, n_games, plate_appearances) in engines.items():
+        results['engines'][name] = benchmark_engine(run, n_games, plate_appearances, repeat, memory)
+    return results
+
+
+######################################################################################
+# Baselines
+######################################################################################
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    '''Returns a message for every metric of results that is more than tolerance worse than in baseline (startup times,
+    engine rates and peak memory). Raises a ValueError when the two were run with different settings'''
+    if results['settings'] != baseline['settings']:
+        raise ValueError(f"The baseline was recorded with different settings: {baseline['settings']}")
+
+    regressions = []
+    def check(name, value, baseline_value, higher_is_better):
+        if value is None or baseline_value is None:
+            return
+        change = value / baseline_value - 1
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f'{name}: {value:.4g} vs {baseline_value:.4g} in the baseline ({change:+.0%})')
+
+    for metric, value in results['startup'].items():
+        check(f'startup {metric}', value, baseline['startup'].get(metric), False)
+    for engine, metrics in results['engines'].items():
+        baseline_metrics = baseline['engines'].get(engine, {})
+        check(f'{engine} plate_appearances_per_second', metrics['plate_appearances_per_second'], baseline_metrics.get('plate_appearances_per_second'), True)
+        check(f'{engine} games_per_second', metrics['games_per_second'], baseline_metrics.get('games_per_second'), True)
+        check(f'{engine} peak_memory_bytes', metrics['peak_memory_bytes'], baseline_metrics.get('peak_memory_bytes'), False)
+    return regressions
+
+
+def write_results(results, path):
+    with open(path, 'w') as fpath:
+        json.dump(results, fpath, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r') as fpath:
+        return json.load(fpath)
+
+
+if __name__ == '__main__':
+    results = run_benchmarks()
+    write_results(results, RESULTS_PATH)
+    for engine, metrics in results['engines'].items():
+        print(f"{engine}: {metrics['plate_appearances_per_second']:,.0f} PAs/s, {metrics['games_per_second']:,.1f} games/s")
+
+    if '--write-baseline' in sys.argv:
+        write_results(results, BASELINE_PATH)
+    else:
+        try:
+            baseline = load_results(BASELINE_PATH)
+        except FileNotFoundError:
+            print(f'No baseline at {BASELINE_PATH}, run with --write-baseline to record one')
+            sys.exit(1)
+        regressions = compare_to_baseline(results, baseline)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
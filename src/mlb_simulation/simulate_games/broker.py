@@ -0,0 +1,84 @@
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceBroker():
+    '''Coalesces the model calls of concurrent simulations into batches. Coroutines await predict_proba(inputs) and the
+    broker stacks everyone's rows, flushing once max_batch_size rows are waiting or max_delay seconds after the first row
+    came in, then runs one predict(batch) call on its worker thread and hands each caller back its own rows.
+    predict is a function of a stacked array of rows, e.g. GameSimulation.predict_model_inputs. The worker thread is a single
+    one by default, so the model is never called from two threads at once'''
+    def __init__(self, predict, max_batch_size=4096, max_delay=0.002, executor=None):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=1)
+        self._pending = [] # (inputs, future) waiting for the next flush
+        self._pending_rows = 0
+        self._timer = None
+        self._tasks = set()
+
+        # Model calls made and rows predicted, to see how well the calls are being batched
+        self.n_calls = 0
+        self.n_rows = 0
+
+    async def predict_proba(self, inputs):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((inputs, future))
+        self._pending_rows += len(inputs)
+        if self._pending_rows >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_rows = self._pending, [], 0
+        task = asyncio.get_running_loop().create_task(self._run(pending))
+        self._tasks.add(task) # The loop only keeps weak references to its tasks
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending):
+        batch = np.concatenate([inputs for inputs, _ in pending])
+        try:
+            probabilities = await asyncio.get_running_loop().run_in_executor(self.executor, self.predict, batch)
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.n_calls += 1
+        self.n_rows += len(batch)
+
+        for (_, future), rows in zip(pending, np.split(probabilities, np.cumsum([len(inputs) for inputs, _ in pending])[:-1])):
+            if not future.done():
+                future.set_result(rows)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def _simulate_games_concurrently(games, n_games, broker):
+    return await asyncio.gather(*[game.simulate_games_arrays_async(n_games, broker) for game in games])
+
+
+def simulate_games_concurrently(games, n_games, max_batch_size=4096, max_delay=0.002, arrays=False):
+    '''Simulates n_games of every GameSimulation in games at once (they have to share a PA model and context), with their
+    model calls batched together by an InferenceBroker. Returns each game's simulate_games results (simulate_games_arrays
+    results when arrays is True) and the broker. The box score DataFrames are only built once every game is done, so
+    they don't hold up the other games' model calls'''
+    broker = InferenceBroker(games[0].predict_model_inputs, max_batch_size, max_delay)
+    try:
+        results = asyncio.run(_simulate_games_concurrently(games, n_games, broker))
+    finally:
+        broker.close()
+    if not arrays:
+        results = [game._batch_box_scores_to_dfs() for game in games]
+    return results, broker
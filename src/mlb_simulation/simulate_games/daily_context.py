@@ -0,0 +1,65 @@
+import pandas as pd
+import pickle as pkl
+
+from utils import convert_rotowire_weather_to_proference
+
+
+class DailyContext():
+    '''Everything a GameSimulation needs that only depends on the date: the daily rolled stats, the expected weather and the
+    ballpark names. It is loaded and indexed once, then shared read only by every game of the slate (forked workers
+    included). The frames can also be passed in directly instead of being read from the pickles'''
+    def __init__(self, date, daily_dataset=None, expected_weather=None, name_conversions=None):
+        self.date = date
+        self.year, self.month, self.day = str(self.date.year), str(self.date.month), str(self.date.day)
+
+        # Grab the daily rolled stats
+        if daily_dataset is None:
+            with open(f'../../../../MLB-Data/daily_stats_dfs/daily_stats_df_updated_{self.year.zfill(2)}-{self.month.zfill(2)}-{self.day.zfill(2)}.pkl', 'rb') as fpath:
+                daily_dataset = pkl.load(fpath)
+        self.daily_dataset = daily_dataset.drop(columns = ['play_type', 'is_on_base'], errors='ignore')
+        self.feature_columns = self.daily_dataset.columns
+
+        # Grab the expected weather data
+        if expected_weather is None:
+            with open(f'../../../../MLB-Data/rotowire_weather_data/weather_data_updated_{self.year.zfill(2)}-{self.month.zfill(2)}-{self.day.zfill(2)}.pkl', 'rb') as fpath:
+                expected_weather = pkl.load(fpath)
+        self.expected_weather = expected_weather
+
+        # Grab the team name conversions for the weather conversion
+        if name_conversions is None:
+            name_conversions = pd.read_excel('../build_datasets/data/non_mlb_data/Ballpark Info.xlsx', header=2)
+        self.name_conversions = name_conversions
+        self.ballparks = self.name_conversions.drop_duplicates('Full Name').set_index('Full Name').Stadium.to_dict()
+
+        # Get the individual stats for each batter and pitcher + the league at the given moment
+        batter_stats = self.daily_dataset.groupby(by='batter').last()
+        batter_stats = batter_stats[[col for col in batter_stats.columns if 'PA' in col and 'LA' not in col and 'pitcher' not in col]]
+
+        pitcher_stats = self.daily_dataset.groupby(by='pitcher').last()
+        pitcher_stats = pitcher_stats[[col for col in pitcher_stats.columns if 'PA' in col and 'LA' not in col and 'pitcher' in col]]
+
+        LA_stats = self.daily_dataset.iloc[-1] #Just pull the final row bc we know that all the LA columns are the same for the given day
+        LA_stats = LA_stats[[col for col in LA_stats.index if 'LA' in col]]
+
+        # Turn the stats into dicts for faster access
+        self.batter_stats = dict(batter_stats.T)
+        self.pitcher_stats = dict(pitcher_stats.T)
+        self.LA_stats = pd.Series(LA_stats)
+
+        # Handedness comes from each player's last pitbat (batter hand first, pitcher hand second)
+        last_batter_rows = self.daily_dataset.drop_duplicates('batter', keep='last')
+        last_pitcher_rows = self.daily_dataset.drop_duplicates('pitcher', keep='last')
+        self.batter_handedness = dict(zip(last_batter_rows.batter, last_batter_rows.pitbat.str[0]))
+        self.pitcher_handedness = dict(zip(last_pitcher_rows.pitcher, last_pitcher_rows.pitbat.str[1]))
+
+        self._weather = {}
+
+    def ballpark(self, home_team):
+        return self.ballparks[home_team]
+
+    def weather(self, home_team):
+        # Returns the (weather row, converted weather) of the home team's game, converting it only the first time
+        if home_team not in self._weather:
+            weather_row = self.expected_weather[self.expected_weather.game_id.str.contains(home_team)].iloc[0] # Just grabs the first game - this 'fails' if 2x header
+            self._weather[home_team] = (weather_row, convert_rotowire_weather_to_proference(weather_row))
+        return self._weather[home_team]
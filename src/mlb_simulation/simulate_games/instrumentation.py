@@ -0,0 +1,89 @@
+import atexit
+import json
+import os
+from functools import wraps
+from time import perf_counter
+
+
+# Setting INSTRUMENT_ENV_VAR (to anything but 0/false) instruments every GameSimulation of the process with one shared timer.
+# If REPORT_ENV_VAR is set too, that timer's report is written there on exit ({pid} is filled in, for pool workers)
+INSTRUMENT_ENV_VAR = 'MLB_SIM_INSTRUMENT'
+REPORT_ENV_VAR = 'MLB_SIM_INSTRUMENT_REPORT'
+
+# The GameSimulation methods that get timed. Times are inclusive, so e.g. simulate_inning also holds its predict_PA time
+STAGES = ['simulate_game', 'simulate_inning', 'make_PA_row', 'predict_PA', 'handle_outcome', '_update_boxscore', '_credit_rbis',
+          '_finalize_box_score', 'compile_outcome_probabilities', '_start_games_batch', '_run_games_batch', '_predict_batch',
+          '_step_games_batch', '_apply_outcomes_batch', '_end_half_innings_batch', '_batch_box_scores_to_dfs']
+
+# Calls that also count plate appearances or games: stage -> (counter, number counted from the call's arguments)
+COUNTERS = {'predict_PA': ('plate_appearances', lambda args: 1), '_step_games_batch': ('plate_appearances', lambda args: len(args[0])),
+            'simulate_game': ('games', lambda args: 1), '_start_games_batch': ('games', lambda args: args[0])}
+
+
+class SimulationTimer():
+    '''Cumulative wall time and call counts per stage of the simulation, plus plate appearance and game counts. A timer
+    can be shared by any number of GameSimulations (see instrument)'''
+    def __init__(self):
+        self.started = perf_counter()
+        self.calls = {}
+        self.seconds = {}
+        self.counts = {'plate_appearances': 0, 'games': 0}
+
+    def wrap(self, stage, function):
+        self.calls.setdefault(stage, 0)
+        self.seconds.setdefault(stage, 0.0)
+        counter, count = COUNTERS.get(stage, (None, None))
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds[stage] += perf_counter() - start
+                self.calls[stage] += 1
+                if counter is not None:
+                    self.counts[counter] += count(args)
+        return timed
+
+    def report(self):
+        wall_time = perf_counter() - self.started
+        # Time spent playing games: whole scalar games plus the steps of the batched engine (run directly or through a broker)
+        engine_time = sum(self.seconds.get(stage, 0.0) for stage in ['simulate_game', '_start_games_batch', '_predict_batch', '_step_games_batch'])
+        return {'wall_seconds': wall_time,
+                'engine_seconds': engine_time,
+                'plate_appearances': self.counts['plate_appearances'],
+                'games': self.counts['games'],
+                'plate_appearances_per_second': self.counts['plate_appearances'] / engine_time if engine_time else None,
+                'games_per_second': self.counts['games'] / engine_time if engine_time else None,
+                'stages': {stage: {'calls': self.calls[stage], 'seconds': self.seconds[stage],
+                                   'mean_microseconds': 1e6 * self.seconds[stage] / self.calls[stage] if self.calls[stage] else None}
+                           for stage in self.calls if self.calls[stage]}}
+
+    def write_report(self, path):
+        with open(path, 'w') as fpath:
+            json.dump(self.report(), fpath, indent=2)
+
+
+def instrument(game, timer=None):
+    '''Swaps the STAGES methods of one GameSimulation for timed wrappers, so an uninstrumented game runs the plain methods
+    with no overhead at all. Returns the timer'''
+    timer = timer if timer is not None else SimulationTimer()
+    for stage in STAGES:
+        setattr(game, stage, timer.wrap(stage, getattr(game, stage)))
+    return timer
+
+
+_process_timer = None
+
+
+def environment_timer():
+    '''The process wide timer when INSTRUMENT_ENV_VAR is set, otherwise None'''
+    global _process_timer
+    if os.environ.get(INSTRUMENT_ENV_VAR, '0').lower() in ('', '0', 'false'):
+        return None
+    if _process_timer is None:
+        _process_timer = SimulationTimer()
+        if os.environ.get(REPORT_ENV_VAR):
+            atexit.register(lambda: _process_timer.write_report(os.environ[REPORT_ENV_VAR].format(pid=os.getpid())))
+    return _process_timer
@@ -0,0 +1,97 @@
+import numpy as np
+from scipy import sparse
+
+
+# Live states of a half inning: lineup slot due up (1-9), bases (on_1b + 2*on_2b + 4*on_3b) and outs
+N_STATES = 9 * 8 * 3
+MAX_RUNS_PER_PA = 4
+
+
+def _state_index(slot, bases, outs):
+    return ((slot - 1) * 8 + bases) * 3 + outs
+
+
+def _next_slot(slot):
+    # Same circular lineup as simulate_inning (slot 8 is followed by slot 1)
+    next_slot = (slot + 1) % 9
+    return 1 if next_slot == 0 else next_slot
+
+
+def _add_runs(distribution, moved, runs):
+    # Shift moved by runs along its last (runs) axis into distribution, piling anything past the last bin into it
+    if runs == 0:
+        distribution += moved
+    else:
+        distribution[..., runs:] += moved[..., :-runs]
+        distribution[..., -1] += moved[..., -runs:].sum(axis=-1)
+
+
+def _transition_entries(transitions):
+    # Flattens the base_running_transitions table into parallel arrays of (outcome code, bases, outs) -> entry
+    entries = [(code, bases, outs, *entry) for code, by_bases in enumerate(transitions) for bases, by_outs in enumerate(by_bases)
+               for outs, outs_entries in enumerate(by_outs) for entry in outs_entries]
+    codes, bases, outs, probability, new_bases, new_outs, runs, rbis = (np.array(column) for column in zip(*entries))
+    return codes, bases, outs, probability, new_bases, new_outs, runs
+
+
+def half_inning_kernel(probabilities, transitions, max_runs=30, tolerance=1e-12, max_plate_appearances=200):
+    '''probabilities[slot - 1, bases, outs, outcome] are the batting team's outcome probabilities for the inning and
+    transitions is the base_running_transitions table. Propagates the exact distribution over the live states until the
+    half inning is over. Returns kernel[start slot - 1, end slot - 1, runs]: the chance that a half inning led off by the
+    start slot ends with the end slot due up next inning and runs scored (the last bin holds max_runs or more)'''
+    # Split the one PA transitions by the runs they score: moves[runs] is a sparse map of the live states to the live + ended states
+    codes, bases, outs, probability, new_bases, new_outs, runs = _transition_entries(transitions)
+    states, new_states, values = [], [], []
+    for slot in range(1, 10):
+        states.append(_state_index(slot, bases, outs))
+        new_states.append(np.where(new_outs >= 3, N_STATES + _next_slot(slot) - 1, _state_index(_next_slot(slot), new_bases, np.minimum(new_outs, 2))))
+        values.append(probabilities[slot - 1, bases, outs, codes] * probability)
+    states, new_states, values, slot_runs = np.concatenate(states), np.concatenate(new_states), np.concatenate(values), np.tile(runs, 9)
+    moves = [sparse.csr_matrix((values[slot_runs == n], (new_states[slot_runs == n], states[slot_runs == n])), shape=(N_STATES + 9, N_STATES))
+             for n in range(MAX_RUNS_PER_PA + 1)]
+
+    # Distribution over (state, start slot, runs), starting from nobody on and nobody out
+    live = np.zeros((N_STATES, 9, max_runs + 1))
+    for slot in range(1, 10):
+        live[_state_index(slot, 0, 0), slot - 1, 0] = 1
+    ended = np.zeros((9, 9, max_runs + 1))
+
+    for _ in range(max_plate_appearances):
+        step = np.zeros((N_STATES + 9, 9, max_runs + 1))
+        for runs in range(MAX_RUNS_PER_PA + 1):
+            _add_runs(step, (moves[runs] @ live.reshape(N_STATES, -1)).reshape(step.shape), runs)
+        live = step[:N_STATES]
+        ended += step[N_STATES:]
+        if live.sum() < tolerance:
+            break
+
+    return ended.transpose(1, 0, 2)
+
+
+def team_run_distribution(kernels, max_runs=30):
+    # Chains the team's half inning kernels, carrying the slot due up from one inning to the next. Returns P(runs)
+    distribution = np.zeros((9, max_runs + 1)) # slot due up, runs so far
+    distribution[0, 0] = 1
+    for kernel in kernels:
+        next_distribution = np.zeros_like(distribution)
+        for runs in range(max_runs + 1):
+            _add_runs(next_distribution, np.einsum('sr,se->er', distribution, kernel[:, :, runs]), runs)
+        distribution = next_distribution
+    return distribution.sum(axis=0)
+
+
+def game_run_distributions(probabilities, transitions, innings_to_simulate, max_runs=30):
+    '''probabilities[team, slot - 1, bases, outs, inning - 1, outcome] (team 0 is home, 1 is away). Innings are played
+    like simulate_game: the away team bats in every inning, the home team only before the 9th.
+    Returns the run distributions of both teams plus the home win/away win/tie chances'''
+    home_innings = range(min(innings_to_simulate, 8))
+    away_innings = range(innings_to_simulate)
+    home_runs = team_run_distribution([half_inning_kernel(probabilities[0, :, :, :, inning], transitions, max_runs)
+                                       for inning in home_innings], max_runs)
+    away_runs = team_run_distribution([half_inning_kernel(probabilities[1, :, :, :, inning], transitions, max_runs)
+                                       for inning in away_innings], max_runs)
+
+    # The two teams' runs are independent given the model inputs, so the joint is their outer product
+    joint = np.outer(home_runs, away_runs)
+    return {'home': home_runs, 'away': away_runs,
+            'home_win': np.tril(joint, -1).sum(), 'away_win': np.triu(joint, 1).sum(), 'tie': np.trace(joint)}
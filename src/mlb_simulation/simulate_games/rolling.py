@@ -0,0 +1,87 @@
+import re
+import numpy as np
+
+import build_datasets.constants as constants
+
+
+def rolling_windows(feature_columns):
+    # The rolling window lengths of a daily dataset, from its batter columns ({window}_PA_{play type})
+    return sorted({int(match.group(1)) for match in (re.match(r'^(\d+)_PA_', column) for column in feature_columns) if match})
+
+
+def rolling_columns(windows, prefix='', play_types=constants.PLAY_TYPES):
+    # The rolled stat columns of a player, in the (window, play type) order of RollingStats.shares. Pitchers use prefix='pitcher_'
+    return [f'{prefix}{window}_PA_{play}' for window in windows for play in play_types]
+
+
+class RollingStats():
+    '''In game rolling play shares for the players of a game, updated after every simulated PA the same way training rolls
+    them: each window holds a player's last window plays as play type vectors (1 in the play's column, times the play's
+    neutralization value) and the shares are the window sums renormalized to 1.
+
+    The pre game contents of each window are fixed-size ring buffers shared by every simulated game, (n_players, window,
+    n_play_types) arrays ordered oldest first. They default to window copies of the player's pre game shares, since the
+    daily dataset only has the rolled shares, so each simulated play then pushes out one average play. Each simulated game
+    only keeps its window sums and its own plays, which overwrite the oldest entries of the buffers: the k-th in game play
+    of a player pushes out pre game entry k of a window, or in game play k - window once a window has been turned over.
+    An update is then a handful of array writes per window whatever the window lengths, and the per game memory doesn't
+    grow with them, which keeps large batches of games affordable'''
+    def __init__(self, shares, windows, outcome_play_types, buffers=None, play_values=None):
+        '''shares is (n_players, n_windows, n_play_types) with the pre game shares, windows the window lengths and
+        outcome_play_types the play type index of each outcome code. buffers optionally replaces the default pre game
+        buffers, one per window. play_values is the value credited for each outcome code (1 for all by default, which
+        treats the simulated plays as already neutral)'''
+        self.shares = np.asarray(shares, dtype=float)
+        self.windows = list(windows)
+        self.n_players, _, self.n_play_types = self.shares.shape
+        self.outcome_play_types = np.asarray(outcome_play_types)
+        self.play_values = np.ones(len(self.outcome_play_types)) if play_values is None else np.asarray(play_values, dtype=float)
+        if buffers is None:
+            buffers = [np.repeat(self.shares[:, i, None], window, axis=1) for i, window in enumerate(self.windows)]
+        self.buffers = [np.asarray(buffer, dtype=float) for buffer in buffers]
+        self.pregame_sums = np.stack([buffer.sum(axis=1) for buffer in self.buffers], axis=1)
+        self.start(1)
+
+    def start(self, n_games, capacity=8):
+        # Resets n_games games to the pre game windows. The in game plays are logged in arrays that grow as needed
+        self.sums = np.repeat(self.pregame_sums[None], n_games, axis=0)
+        self._pair_sums = self.sums.reshape(n_games * self.n_players, -1) # A view with one row per (game, player), which indexes faster
+        self.counts = np.zeros((n_games, self.n_players), dtype=int)
+        self._play_types = np.zeros((n_games, self.n_players, capacity), dtype=int)
+        self._values = np.zeros((n_games, self.n_players, capacity))
+
+    def update(self, games, players, outcomes):
+        '''Rolls one play into each (game, player) pair, where outcomes are outcome codes. A pair can only appear once per call'''
+        games, players = np.asarray(games), np.asarray(players)
+        play_types, values = self.outcome_play_types[outcomes], self.play_values[outcomes]
+        counts = self.counts[games, players]
+        if counts.max(initial=-1) >= self._play_types.shape[2]:
+            self._play_types = np.concatenate([self._play_types, np.zeros_like(self._play_types)], axis=2)
+            self._values = np.concatenate([self._values, np.zeros_like(self._values)], axis=2)
+
+        # Every window gains the play and loses the one it pushes out, a pre game one until the window has been turned over
+        change = np.zeros((len(games), len(self.windows), self.n_play_types))
+        change[np.arange(len(games)), :, play_types] = values[:, None]
+        for i, (window, buffer) in enumerate(zip(self.windows, self.buffers)):
+            pregame = counts < window
+            if pregame.all():
+                change[:, i] -= buffer[players, counts]
+            else:
+                change[pregame, i] -= buffer[players[pregame], counts[pregame]]
+                g, p, k = games[~pregame], players[~pregame], counts[~pregame] - window
+                change[np.flatnonzero(~pregame), i, self._play_types[g, p, k]] -= self._values[g, p, k]
+        pairs = games * self.n_players + players
+        self._pair_sums[pairs] += change.reshape(len(pairs), -1)
+
+        self._play_types[games, players, counts] = play_types
+        self._values[games, players, counts] = values
+        self.counts[games, players] += 1
+
+    def current_shares(self, games, players):
+        # (n, n_windows, n_play_types) shares of each (game, player) pair
+        sums = self._pair_sums[np.asarray(games) * self.n_players + np.asarray(players)].reshape(-1, len(self.windows), self.n_play_types)
+        return sums / sums.sum(axis=-1, keepdims=True)
+
+    def share_changes(self, games, players):
+        # current_shares minus the pre game shares, flattened in rolling_columns order
+        return (self.current_shares(games, players) - self.shares[players]).reshape(len(games), -1)
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class OutcomeSampler():
+    '''Draws PA outcomes and base running coin flips from a dedicated numpy Generator.
+    Uniforms are drawn in blocks of block_size and handed out as needed. Outcomes are sampled by inverse CDF over the
+    cumulative probabilities and returned as integer codes (the column order of predict_proba), so any mapping to outcome
+    names is left to the caller'''
+    def __init__(self, rng=None, block_size=4096):
+        # rng can be a Generator, or anything np.random.default_rng takes (None, an int seed, a SeedSequence)
+        self.rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+        self.block_size = block_size
+        self._block = self.rng.random(block_size)
+        self._position = 0
+
+    def uniforms(self, n):
+        # Returns the next n uniforms of the stream, refilling the block when it runs out
+        if self._position + n > len(self._block):
+            self._block = np.concatenate([self._block[self._position:], self.rng.random(max(self.block_size, n))])
+            self._position = 0
+        values = self._block[self._position:self._position + n]
+        self._position += n
+        return values
+
+    def random(self):
+        if self._position == len(self._block):
+            self._block = self.rng.random(self.block_size)
+            self._position = 0
+        value = self._block[self._position]
+        self._position += 1
+        return value
+
+    def sample(self, probabilities):
+        # probabilities is a single probability vector (returns one code) or one row per draw (returns an array of codes)
+        cumulative = np.cumsum(probabilities, axis=-1)
+        if cumulative.ndim == 1:
+            return min(int(np.searchsorted(cumulative, self.random(), side='right')), len(cumulative) - 1)
+
+        # Vectorized searchsorted over the rows: count the cumulative probabilities at or below each row's uniform
+        codes = (cumulative <= self.uniforms(len(cumulative))[:, None]).sum(axis=1)
+        return np.minimum(codes, cumulative.shape[1] - 1)
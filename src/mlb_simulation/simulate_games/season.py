@@ -0,0 +1,238 @@
+import os
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from simulate import GameSimulation
+from daily_context import DailyContext
+from aggregation import StatAggregator
+
+
+# Stats tracked for every team and season. division_title and playoffs are 0/1, so their means are the odds
+SEASON_STATS = ['wins', 'losses', 'runs_scored', 'runs_allowed', 'division_title', 'playoffs']
+
+# Playoff spots per league on top of the division winners. Leagues are the first word of the division names ('AL East' -> 'AL')
+WILD_CARDS = 3
+
+# Per worker process state, like slate.py: the pairing GameSimulations are built from the model/encoder/context handed to the
+# initializer, and season chunks only need the pairing score/run distribution arrays
+_worker_state = {}
+
+
+def neutral_weather(teams):
+    '''Expected weather rows for every home team with dome conditions (no wind and mild temperatures), since a season's
+    weather isn't known ahead of time'''
+    return pd.DataFrame({'game_id': [f'Neutral @ {team}' for team in teams], 'wind_direction': [['zero'] for _ in teams],
+                         'is_dome': [[True] for _ in teams], 'rain_percentage': [[0] for _ in teams],
+                         'temprature': [[72] for _ in teams], 'wind_speed': [[0] for _ in teams]})
+
+
+def schedule_pairings(schedule, lineups):
+    '''The distinct game lineups of a schedule and each game's index into them. schedule has home_team/away_team columns (in
+    the order the games are played) and lineups maps every team to {'lineup': {slot: {'player', 'id'}}, 'rotation':
+    [{'name', 'id'}, ...]}. Each team's starters go through its rotation in schedule order, so a pairing is a home team, an
+    away team and their two starters, and repeat meetings with the same starters share one'''
+    starts = {team: 0 for team in lineups}
+    pairings, pairing_index, game_pairings = [], {}, []
+    for home_team, away_team in zip(schedule.home_team, schedule.away_team):
+        home_pitcher = lineups[home_team]['rotation'][starts[home_team] % len(lineups[home_team]['rotation'])]
+        away_pitcher = lineups[away_team]['rotation'][starts[away_team] % len(lineups[away_team]['rotation'])]
+        starts[home_team] += 1
+        starts[away_team] += 1
+
+        key = (home_team, away_team, home_pitcher['id'], away_pitcher['id'])
+        if key not in pairing_index:
+            pairing_index[key] = len(pairings)
+            pairings.append({'home_team': home_team, 'away_team': away_team,
+                             'home_lineup': lineups[home_team]['lineup'], 'away_lineup': lineups[away_team]['lineup'],
+                             'home_pitcher': home_pitcher, 'away_pitcher': away_pitcher})
+        game_pairings.append(pairing_index[key])
+    return pairings, np.array(game_pairings)
+
+
+def _init_pairing_worker(PA_model, encoder, context, innings_to_simulate, max_runs, games_per_pairing):
+    _worker_state.update(PA_model=PA_model, encoder=encoder, context=context, innings_to_simulate=innings_to_simulate, max_runs=max_runs,
+                         games_per_pairing=games_per_pairing)
+
+
+def _pairing_runs(lineup, seed):
+    # The (games_per_pairing, 2 (home, away)) scores of the pairing's simulated games, or its home/away run distributions
+    game = GameSimulation(_worker_state['context'].date, lineup['home_team'], lineup, _worker_state['PA_model'], _worker_state['encoder'],
+                          innings_to_simulate=_worker_state['innings_to_simulate'], rng=seed, context=_worker_state['context'],
+                          instrumentation=False)
+    if _worker_state['games_per_pairing'] is None:
+        distributions = game.run_distributions(_worker_state['max_runs'])
+        return distributions['home'], distributions['away']
+    game.compile_outcome_probabilities()
+    return game.simulate_games_arrays(_worker_state['games_per_pairing'])[2]
+
+
+def _init_season_worker(tables):
+    _worker_state['tables'] = tables
+
+
+def _simulate_season_chunk(n_seasons, seed):
+    return simulate_season_chunk(_worker_state['tables'], n_seasons, seed)
+
+
+class SeasonAggregator():
+    '''Standings distributions of simulated seasons, aggregated online: a StatAggregator over (team, SEASON_STATS) with
+    each team's wins/losses/runs histograms, plus its division title and playoff odds. Merges like BoxScoreAggregator'''
+    def __init__(self, teams, max_value=1200):
+        self.teams = list(teams)
+        self.stats = StatAggregator(len(self.teams), len(SEASON_STATS), max_value)
+
+    @property
+    def n(self):
+        return self.stats.n
+
+    def update_batch(self, seasons):
+        # seasons is (n_seasons, n_teams, len(SEASON_STATS))
+        self.stats.update(seasons)
+        return self
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        return self
+
+    def summary(self, quantiles=(0.1, 0.5, 0.9)):
+        # One row per team with the mean of every stat, the spread/quantiles of its wins and its division/playoff odds
+        wins = SEASON_STATS.index('wins')
+        summary = pd.DataFrame(self.stats.mean, index=pd.Index(self.teams, name='team'), columns=SEASON_STATS)
+        summary = summary.rename(columns={'division_title': 'division_odds', 'playoffs': 'playoff_odds'})
+        summary['wins_std'] = np.sqrt(self.stats.variance[:, wins])
+        for q in quantiles:
+            summary[f'wins_q{int(round(q * 100))}'] = self.stats.quantile(q)[:, wins]
+        return summary.sort_values('wins', ascending=False)
+
+    def win_distribution(self, team):
+        # The share of seasons ending with each win total
+        counts = self.stats.counts[self.teams.index(team), SEASON_STATS.index('wins')]
+        return pd.Series(counts / max(self.n, 1), name='wins').rename_axis('value')
+
+
+def simulate_season_chunk(tables, n_seasons, seed=None):
+    '''Plays n_seasons of the schedule from the pairing tables of SeasonSimulation.tables. With simulated pairings each
+    game replays one of its pairing's simulated games picked at random, otherwise it draws both teams' runs from its
+    pairing's run distributions by inverse CDF (independently, like in run_distributions). A tied game goes either way with
+    even odds, since games aren't played past innings_to_simulate.
+    Returns the (n_seasons, n_teams, len(SEASON_STATS)) array for SeasonAggregator.update_batch'''
+    rng = np.random.default_rng(seed)
+    pairings, home, away = tables['game_pairings'], tables['home_index'], tables['away_index']
+    n_teams, n_games = len(tables['teams']), len(pairings)
+
+    runs = {}
+    if 'scores' in tables:
+        # Both teams' runs come from the same simulated game, which keeps how the score of one moves the other
+        scores = tables['scores'][pairings, rng.integers(tables['scores'].shape[1], size=(n_seasons, n_games))]
+        runs['home'], runs['away'] = scores[..., 0], scores[..., 1]
+    else:
+        # Every pairing's CDF is shifted up by its index, so one searchsorted over them all samples each game from its own pairing
+        for side in ['home', 'away']:
+            cdfs = tables[f'{side}_cdfs']
+            shifted = (cdfs + np.arange(len(cdfs))[:, None]).ravel()
+            draws = np.searchsorted(shifted, pairings + rng.random((n_seasons, n_games)), side='right')
+            runs[side] = np.minimum(draws - pairings * cdfs.shape[1], cdfs.shape[1] - 1)
+    home_wins = (runs['home'] > runs['away']) | ((runs['home'] == runs['away']) & (rng.random((n_seasons, n_games)) < 0.5))
+
+    # Credit each game to both teams with one bincount per stat over (season, team)
+    offsets = n_teams * np.arange(n_seasons)[:, None]
+    def per_team(home_values, away_values):
+        bins = np.concatenate([(offsets + home).ravel(), (offsets + away).ravel()])
+        return np.bincount(bins, weights=np.concatenate([np.ravel(home_values), np.ravel(away_values)]),
+                           minlength=n_seasons * n_teams).reshape(n_seasons, n_teams)
+    wins = per_team(home_wins, ~home_wins)
+    seasons = np.stack([wins, per_team(~home_wins, home_wins), per_team(runs['home'], runs['away']), per_team(runs['away'], runs['home']),
+                        np.zeros_like(wins), np.zeros_like(wins)], axis=-1)
+
+    # Division winners and wild cards by wins, with ties broken at random
+    if tables['divisions'] is not None:
+        ranking = wins + rng.random(wins.shape)
+        titles, playoffs = seasons[..., SEASON_STATS.index('division_title')], seasons[..., SEASON_STATS.index('playoffs')]
+        for division in np.unique(tables['divisions']):
+            teams = np.flatnonzero(tables['divisions'] == division)
+            titles[np.arange(n_seasons), teams[ranking[:, teams].argmax(axis=1)]] = 1
+        for league in np.unique(tables['leagues']):
+            teams = np.flatnonzero(tables['leagues'] == league)
+            wild_card_ranking = np.where(titles[:, teams] == 1, -np.inf, ranking[:, teams])
+            wild_cards = teams[np.argsort(-wild_card_ranking, axis=1)[:, :WILD_CARDS]]
+            playoffs[np.arange(n_seasons)[:, None], wild_cards] = 1
+        playoffs[titles == 1] = 1
+    return seasons.astype(int)
+
+
+class SeasonSimulation():
+    '''Simulates full seasons of a schedule on top of GameSimulation's outcome model. Every distinct pairing of the
+    schedule (home team, away team and both starters, see schedule_pairings) is built as a GameSimulation once and plays
+    games_per_pairing games (simulate_games_arrays, with compiled outcome probabilities), whose scores then serve every
+    game of that pairing in every season. Playing a season is only drawing from those tables, so thousands of seasons take
+    seconds, and both the pairings and the seasons are spread across processes.
+    With games_per_pairing=None the pairings use the exact run distributions of GameSimulation.run_distributions instead,
+    which hold the model's score features at a tie for the whole game and take the two teams' runs as independent. That
+    ignores how the score moves the outcome odds, so its run totals, win totals and playoff odds can differ a lot from
+    the games GameSimulation plays. max_runs only applies to the run distributions.
+    The stats come from the date's DailyContext (or the one passed in) with neutral weather in every park.
+    divisions optionally maps every team to its division (e.g. 'AL East'), which adds division title and playoff odds.
+    seed seeds the pairing games (simulate takes its own seed for the seasons)'''
+    def __init__(self, date, schedule, lineups, PA_model, encoder, context=None, divisions=None, innings_to_simulate=9, max_runs=30,
+                 games_per_pairing=2000, seed=None, max_workers=None):
+        self.date = date
+        self.schedule = schedule.reset_index(drop=True)
+        self.lineups = lineups
+        self.teams = sorted(set(self.schedule.home_team) | set(self.schedule.away_team))
+        self.max_workers = max_workers or os.cpu_count()
+
+        # The day's stats, but neutral weather for every home team
+        context = context if context is not None else DailyContext(date)
+        self.context = DailyContext(date, context.daily_dataset, neutral_weather(self.teams), context.name_conversions)
+
+        # The simulated scores (or run distributions) of every pairing, computed on a process pool
+        self.pairings, game_pairings = schedule_pairings(self.schedule, lineups)
+        seeds = np.random.SeedSequence(seed).spawn(len(self.pairings))
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_pairing_worker,
+                                 initargs=(PA_model, encoder, self.context, innings_to_simulate, max_runs, games_per_pairing)) as pool:
+            pairing_runs = list(pool.map(_pairing_runs, self.pairings, seeds))
+
+        # Everything a season needs, as plain arrays that are cheap to hand to the season workers
+        team_index = {team: i for i, team in enumerate(self.teams)}
+        self.tables = {'teams': self.teams, 'game_pairings': game_pairings,
+                       'home_index': np.array([team_index[team] for team in self.schedule.home_team]),
+                       'away_index': np.array([team_index[team] for team in self.schedule.away_team]),
+                       'divisions': None, 'leagues': None}
+        if games_per_pairing is not None:
+            self.tables['scores'] = np.stack(pairing_runs).astype(np.int16)
+        else:
+            for i, side in enumerate(['home', 'away']):
+                probabilities = np.array([distribution[i] for distribution in pairing_runs])
+                self.tables[f'{side}_cdfs'] = np.cumsum(probabilities / probabilities.sum(axis=1, keepdims=True), axis=1)
+        if divisions is not None:
+            self.tables['divisions'] = np.array([divisions[team] for team in self.teams])
+            self.tables['leagues'] = np.array([divisions[team].split()[0] for team in self.teams])
+
+    def pairing_odds(self):
+        # Home win/away win/tie odds of every pairing, straight from its simulated games or run distributions
+        odds = pd.DataFrame([{key: lineup[key] for key in ['home_team', 'away_team']} for lineup in self.pairings])
+        odds['home_pitcher'] = [lineup['home_pitcher']['id'] for lineup in self.pairings]
+        odds['away_pitcher'] = [lineup['away_pitcher']['id'] for lineup in self.pairings]
+        if 'scores' in self.tables:
+            home, away = self.tables['scores'][..., 0], self.tables['scores'][..., 1]
+            odds['home_win'], odds['away_win'], odds['tie'] = (home > away).mean(axis=1), (home < away).mean(axis=1), (home == away).mean(axis=1)
+            return odds
+        home, away = np.diff(self.tables['home_cdfs'], prepend=0, axis=1), np.diff(self.tables['away_cdfs'], prepend=0, axis=1)
+        joint = home[:, :, None] * away[:, None, :]
+        odds['home_win'] = np.tril(joint, -1).sum(axis=(1, 2))
+        odds['away_win'] = np.triu(joint, 1).sum(axis=(1, 2))
+        odds['tie'] = np.trace(joint, axis1=1, axis2=2)
+        return odds
+
+    def simulate(self, n_seasons, chunk_size=500, seed=None, aggregator=None):
+        '''Simulates n_seasons seasons, chunk_size at a time across the process pool, folding every chunk into a
+        SeasonAggregator (which is returned). Each chunk draws from its own child of seed, so the results only depend on
+        seed and chunk_size, not on max_workers'''
+        aggregator = aggregator if aggregator is not None else SeasonAggregator(self.teams)
+        sizes = [min(chunk_size, n_seasons - start) for start in range(0, n_seasons, chunk_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_season_worker, initargs=(self.tables,)) as pool:
+            for seasons in pool.map(_simulate_season_chunk, sizes, seeds):
+                aggregator.update_batch(seasons)
+        return aggregator
@@ -1,65 +1,80 @@
 import pandas as pd
 import numpy as np
-import pickle as pkl
+import logging
 import warnings
 import datetime
 import numpy as np
-from numpy import random
 from datetime import datetime as dt
 import datetime
 from get_lineups import mlb_scrape
 
 from build_datasets.dataset_builder import DatasetBuilder
-from utils import convert_rotowire_weather_to_proference
+from sampling import OutcomeSampler
+from daily_context import DailyContext
+from base_running import base_running_transitions, base_running_arrays, load_base_running_transitions, pick_entry
+from markov import game_run_distributions
+from aggregation import BoxScoreAggregator
+from train_models.inference import CompiledPipeline
+from instrumentation import SimulationTimer, instrument, environment_timer
+from rolling import RollingStats, rolling_windows, rolling_columns
+import build_datasets.constants as constants
 
 
 warnings.simplefilter('ignore')
+logger = logging.getLogger(__name__)
+
+# Fixed box score layouts, shared by the single game and batched engines
+BATTER_STATS = ['PAs', 'ABs', 'hits', 'singles', 'doubles', 'triples', 'home_runs', 'walks', 'rbis', 'strikeouts', 'sacs']
+PITCHER_STATS = ['outs', 'strikeouts', 'singles_allowed', 'doubles_allowed', 'triples_allowed', 'home_runs_allowed',
+                 'total_runs_allowed', 'walks_allowed', 'hits_allowed']
+
+# The counting stats credited for each outcome (before any runs/rbis), mirroring handle_outcome
+BATTER_OUTCOME_STATS = {'strikeout': ['strikeouts', 'ABs', 'PAs'], 'field_out': ['PAs', 'ABs'], 'walk': ['walks', 'PAs'],
+                        'single': ['PAs', 'ABs', 'singles'], 'double': ['PAs', 'ABs', 'doubles'], 'home_run': ['PAs', 'ABs', 'home_runs'],
+                        'error': ['PAs', 'ABs'], 'double_play': ['PAs', 'ABs'], 'sacrifice': ['PAs', 'sacs'],
+                        'triple': ['PAs', 'ABs', 'triples'], 'fielders_choice': ['PAs', 'ABs']}
+PITCHER_OUTCOME_STATS = {'strikeout': ['strikeouts', 'outs'], 'field_out': ['outs'], 'walk': ['walks_allowed'],
+                         'single': ['singles_allowed'], 'double': ['doubles_allowed'], 'home_run': ['home_runs_allowed'],
+                         'error': [], 'double_play': ['outs', 'outs'], 'sacrifice': ['outs'],
+                         'triple': ['triples_allowed'], 'fielders_choice': ['outs']}
+BATTER_STAT_INDEX = {stat: i for i, stat in enumerate(BATTER_STATS)}
+PITCHER_STAT_INDEX = {stat: i for i, stat in enumerate(PITCHER_STATS)}
+
+# The game state columns of a PA row, which are the only features that change within a game
+STATE_COLUMNS = ['on_3b', 'on_2b', 'on_1b', 'outs_when_up', 'inning', 'inning_topbot', 'bat_score', 'fld_score']
+
+# Team indexes used by the batched engine. Home comes first to match the box score DataFrames
+HOME, AWAY = 0, 1
 
 
 class GameSimulation():
-    def __init__(self, date, home_team, lineup_dict, PA_model, encoder, verbose=False, innings_to_simulate=1):
+    def __init__(self, date, home_team, lineup_dict, PA_model, encoder, verbose=False, innings_to_simulate=1, rng=None, context=None,
+                 base_running_path=None, instrumentation=None, update_rolling_stats=False):
         self.date = date
         self.year, self.month, self.day = str(self.date.year), str(self.date.month), str(self.date.day)
         self.PA_model = PA_model
         self.encoder = encoder
         self.innings_to_simulate = innings_to_simulate
         self.verbose = verbose
+        self.sampler = OutcomeSampler(rng) # All of the randomness in a game is drawn from here
         self.lineup_dict = lineup_dict
         self.home_lineup = self.lineup_dict['home_lineup']
         self.away_lineup = self.lineup_dict['away_lineup']
         self.home_pitcher = self.lineup_dict['home_pitcher']['id']
         self.away_pitcher = self.lineup_dict['away_pitcher']['id']
 
-        # Grab the daily rolled stats
-        with open(f'../../../../MLB-Data/daily_stats_dfs/daily_stats_df_updated_{self.year.zfill(2)}-{self.month.zfill(2)}-{self.day.zfill(2)}.pkl', 'rb') as fpath:
-            self.daily_dataset = pkl.load(fpath)
-            self.daily_dataset = self.daily_dataset.drop(columns = ['play_type', 'is_on_base'])
-
-        # Grab the expected weather data
-        with open(f'../../../../MLB-Data/rotowire_weather_data/weather_data_updated_{self.year.zfill(2)}-{self.month.zfill(2)}-{self.day.zfill(2)}.pkl', 'rb') as fpath:
-            self.expected_weather = pkl.load(fpath)
-
-        # Grab the team name conversions for the weather conversion
-        self.name_conversions = pd.read_excel('../build_datasets/data/non_mlb_data/Ballpark Info.xlsx', header=2)
-
-        # Get the individual stats for each batter and pitcher + the league at the given moment, so we can pull them as needed for a given at bat
-        batter_stats = self.daily_dataset.groupby(by='batter').last()
-        batter_stats = batter_stats[[col for col in batter_stats.columns if 'PA' in col and 'LA' not in col and 'pitcher' not in col]]
-
-        pitcher_stats = self.daily_dataset.groupby(by='pitcher').last()
-        pitcher_stats = pitcher_stats[[col for col in pitcher_stats.columns if 'PA' in col and 'LA' not in col and 'pitcher' in col]]
-
-        LA_stats = self.daily_dataset.iloc[-1] #Just pull the final row bc we know that all the LA columns are the same for the given day
-        LA_stats = LA_stats[[col for col in LA_stats.index if 'LA' in col]]
-
-        # Turn the stats into dicts for faster access
-        self.batter_stats = dict(batter_stats.T)
-        self.pitcher_stats = dict(pitcher_stats.T)
-        self.LA_stats = pd.Series(LA_stats)
+        # The per date data (stats, weather, ballparks) is loaded and indexed once in a DailyContext, which can be shared by games
+        self.context = context if context is not None else DailyContext(date)
+        self.daily_dataset = self.context.daily_dataset
+        self.expected_weather = self.context.expected_weather
+        self.name_conversions = self.context.name_conversions
+        self.batter_stats = self.context.batter_stats
+        self.pitcher_stats = self.context.pitcher_stats
+        self.LA_stats = self.context.LA_stats
 
         # Finally, Initialize the game state
         self.home_team = home_team
-        self.home_park = self.name_conversions[self.name_conversions['Full Name'] == self.home_team].Stadium.iloc[0]
+        self.home_park = self.context.ballpark(self.home_team)
         self.inning = 1
         self.inning_topbot = 1 # 1 for top 0 for bottom
         self.pitbat = None
@@ -72,12 +87,59 @@ class GameSimulation():
         self.score_tracker = {'home':0, 'away':0}
         
         # Initialize Weather info
-        self.weather_row = self.expected_weather[self.expected_weather.game_id.str.contains(self.home_team)].iloc[0] # Just grabs the first game - this 'fails' if 2x header
-        self.converted_weather = convert_rotowire_weather_to_proference(self.weather_row)
+        self.weather_row, self.converted_weather = self.context.weather(self.home_team)
 
         # Initialize handedness dictionaries
-        self.batter_handedness = self.daily_dataset.groupby('batter')['pitbat'].apply(lambda x: x.iloc[-1][0]).to_dict()
-        self.pitcher_handedness = self.daily_dataset.groupby('pitcher')['pitbat'].apply(lambda x: x.iloc[-1][1]).to_dict()
+        self.batter_handedness = self.context.batter_handedness
+        self.pitcher_handedness = self.context.pitcher_handedness
+
+        # Precompile the feature rows for every batter vs opposing starter matchup in the game
+        self.feature_columns = self.context.feature_columns
+        self.state_column_indexes = [self.feature_columns.get_loc(col) for col in STATE_COLUMNS]
+        self._build_matchup_features()
+
+        # Scaling, PCA and one hot encoding are linear, so they are compiled into arrays with the matchup part of every row
+        # precomputed. A PA then only adds in its game state and calls the final estimator. Exported models (NativePredictor) are
+        # already compiled, anything else goes through PA_model as is
+        try:
+            compiled = self.PA_model if isinstance(self.PA_model, CompiledPipeline) else CompiledPipeline(self.PA_model, self.feature_columns)
+            self.matchup_model = compiled.bind(self.matchup_features, STATE_COLUMNS, columns=self.feature_columns)
+        except ValueError as error:
+            logger.warning(f'The PA model could not be compiled, falling back to calling it on every prediction: {error}')
+            self.matchup_model = None
+
+        # Box scores are kept in integer arrays while simulating: batter rows are team * 9 + lineup slot - 1 and pitcher rows
+        # are the pitching team. They are only turned into the box score DataFrames when finalized
+        self.outcome_names = list(self.encoder.categories_[0])
+        self.outcome_codes = {outcome: code for code, outcome in enumerate(self.outcome_names)}
+        self.batter_outcome_increments, self.pitcher_outcome_increments = self._outcome_stat_increments()
+
+        # Runner movement for every (outcome code, bases, outs), as entries for the scalar engine and dense arrays for the batched one.
+        # The rule based odds are replaced by the empirical ones wherever the base running tables at base_running_path have enough plays
+        self.base_running = base_running_transitions(self.outcome_names)
+        if base_running_path is not None:
+            self.base_running = load_base_running_transitions(base_running_path, self.outcome_names, self.base_running)
+        self.base_running_arrays = base_running_arrays(self.base_running)
+        self.batter_box = np.zeros((18, len(BATTER_STATS)), dtype=int)
+        self.pitcher_box = np.zeros((2, len(PITCHER_STATS)), dtype=int)
+        self._batter_box_template = self._create_batter_boxscore_df(self.lineup_dict)
+        self._pitcher_box_template = self._create_pitcher_boxscore_df(self.lineup_dict)
+        self._batter_box_rows = [team * 9 + slot - 1 for team, lineup in [(HOME, self.home_lineup), (AWAY, self.away_lineup)] for slot in lineup]
+
+        # Filled by compile_outcome_probabilities, after which PAs are a table lookup instead of a model call
+        self.outcome_probabilities = None
+        self.max_score_diff = None
+
+        # With update_rolling_stats, each batter's and pitcher's rolled shares are updated after every PA of a game (see rolling.py)
+        self.rolling = self._build_rolling_stats() if update_rolling_stats else None
+
+        # Per stage timings (see instrumentation.py), off unless instrumentation is True or a (shared) SimulationTimer, or the
+        # MLB_SIM_INSTRUMENT environment variable is set. The timed methods are only swapped in when it is on
+        if instrumentation is None:
+            instrumentation = environment_timer()
+        elif instrumentation is True:
+            instrumentation = SimulationTimer()
+        self.timer = instrument(self, instrumentation) if instrumentation else None
     
     def _get_pitbat(self, batter_id, pitcher_id):
         batter_hand = self.batter_handedness.get(batter_id, "X")
@@ -94,7 +156,7 @@ class GameSimulation():
         away_team = lineup_dict['away_team']
 
         # Initialize example stats (replace these with real data if available)
-        stats_columns = ['PAs', 'ABs', 'hits', 'singles', 'doubles', 'triples', 'home_runs', 'walks', 'rbis', 'strikeouts', 'sacs']
+        stats_columns = BATTER_STATS
         example_stats = {column: [0] * len(home_lineup) for column in stats_columns}  # Initialize with 0 or some other value
 
         # Create a DataFrame for the home team
@@ -130,8 +192,7 @@ class GameSimulation():
         away_team = lineup_dict['away_team']
 
         # Initialize example pitching stats with a length of 2 (one for each pitcher)
-        pitcher_stats_columns = ['outs', 'strikeouts', 'singles_allowed', 'doubles_allowed', 'triples_allowed', 'home_runs_allowed',
-                                'total_runs_allowed', 'walks_allowed', 'hits_allowed']
+        pitcher_stats_columns = PITCHER_STATS
         example_pitching_stats = {column: [0] for column in pitcher_stats_columns}  # 2 values for the home and away pitcher
 
         # Create a DataFrame for the home pitcher
@@ -157,55 +218,134 @@ class GameSimulation():
 
         return full_pitcher_df
     
-    def _update_boxscore(self, boxscore, id, stat, value=1):
-        if type(stat) == str:
-            boxscore.loc[id, stat] += value
-        else:
-            for s in stat:
-                boxscore.loc[id, s] += value
+    def _outcome_stat_increments(self):
+        # Turn the outcome -> stats mappings into (n_outcomes, n_stats) increment arrays in the model's outcome order
+        batter_increments = np.zeros((len(self.outcome_codes), len(BATTER_STATS)), dtype=int)
+        pitcher_increments = np.zeros((len(self.outcome_codes), len(PITCHER_STATS)), dtype=int)
+        for outcome, code in self.outcome_codes.items():
+            for stat in BATTER_OUTCOME_STATS.get(outcome, []):
+                batter_increments[code, BATTER_STAT_INDEX[stat]] += 1
+            for stat in PITCHER_OUTCOME_STATS.get(outcome, []):
+                pitcher_increments[code, PITCHER_STAT_INDEX[stat]] += 1
+        return batter_increments, pitcher_increments
+
+    def _update_boxscore(self, boxscore, slot, stat, value=1):
+        # boxscore is one of the box score arrays, slot its row and stat a column index (or a list of them)
+        boxscore[slot, stat] += value
         return boxscore
 
+    def _credit_rbis(self, value=1):
+        # Runs driven in count for the batter and against the pitcher
+        self._update_boxscore(self.batter_box, self.current_batter_slot, BATTER_STAT_INDEX['rbis'], value)
+        self._update_boxscore(self.pitcher_box, self.current_pitcher_slot, PITCHER_STAT_INDEX['total_runs_allowed'], value)
+
     def _finalize_box_score(self, boxscore, is_batter):
+        # Turn the box score array into its DataFrame, then aggregate some stats
         if is_batter == True:
+            stats = boxscore[self._batter_box_rows]
+            boxscore = self._batter_box_template.copy()
+            boxscore[BATTER_STATS] = stats
             boxscore.hits = boxscore.singles + boxscore.doubles + boxscore.triples + boxscore.home_runs
             boxscore['total_bases'] = boxscore.singles + 2*boxscore.doubles + 3*boxscore.triples + 4*boxscore.home_runs
         else:
+            stats = boxscore
+            boxscore = self._pitcher_box_template.copy()
+            boxscore[PITCHER_STATS] = stats
             boxscore.hits_allowed = boxscore.singles_allowed + boxscore.doubles_allowed + boxscore.triples_allowed + boxscore.home_runs_allowed
             boxscore['total_bases_allowed'] = boxscore.singles_allowed + 2*boxscore.doubles_allowed + 3*boxscore.triples_allowed + 4*boxscore.home_runs_allowed
 
         return boxscore
     
-    def make_PA_row(self, batter_id, pitcher_id):
-        data = {
-            'ballpark': self.home_park,
-            'batter': batter_id,
-            'pitcher': pitcher_id,
-            'pitbat': self._get_pitbat(batter_id, pitcher_id),
-            'on_3b': self.on_3b,
-            'on_2b': self.on_2b,
-            'on_1b': self.on_1b,
-            'outs_when_up': self.outs_when_up,
-            'inning': self.inning,
-            'inning_topbot': self.inning_topbot,
-            'bat_score': self.bat_score,
-            'fld_score': self.field_score
-            }
-
-        series = pd.Series(data)
-
-        # Insert the batting, pitching, and LA stats
-        batter_stats = self.batter_stats[batter_id]
-        pitcher_stats = self.pitcher_stats[pitcher_id]
-        LA_stats = self.LA_stats
+    def _build_matchup_features(self):
+        # Build one row per batter vs opposing starter (home lineup then away lineup, by lineup slot) in the model's column order.
+        # Everything but the game state columns is fixed for the game, so it is only filled in once here
+        self.matchup_index = {}
+        rows = []
+        for lineup, pitcher_id in [(self.home_lineup, self.away_pitcher), (self.away_lineup, self.home_pitcher)]:
+            for slot in range(1, 10):
+                batter_id, pitcher_id = float(lineup[slot]['id']), float(pitcher_id)
+                data = {
+                    'ballpark': self.home_park,
+                    'batter': batter_id,
+                    'pitcher': pitcher_id,
+                    'pitbat': self._get_pitbat(batter_id, pitcher_id),
+                    **{col: 0 for col in STATE_COLUMNS}
+                    }
+
+                # Insert the batting, pitching, LA and weather data
+                series = pd.concat([pd.Series(data), self.batter_stats[batter_id], self.pitcher_stats[pitcher_id], self.LA_stats,
+                                    pd.Series(self.converted_weather)])
+
+                # Make sure all the columns are in the original order
+                self.matchup_index[(batter_id, pitcher_id)] = len(rows)
+                rows.append(series[self.feature_columns].values)
+
+        self.matchup_features = np.array(rows, dtype=object)
+
+    def _build_rolling_stats(self):
+        # The game's players are its batters, in batter box row order (which is the matchup row order too), then the home and away
+        # starters. The rolled columns are swapped into the feature rows, or added onto the compiled matchup rows as the change
+        # of their projection since the start of the game
+        windows = rolling_windows(self.feature_columns)
+        batter_columns, pitcher_columns = rolling_columns(windows), rolling_columns(windows, 'pitcher_')
+        players = [(self.batter_stats[float(lineup[slot]['id'])], batter_columns) for lineup in [self.home_lineup, self.away_lineup] for slot in range(1, 10)]
+        players += [(self.pitcher_stats[float(pitcher_id)], pitcher_columns) for pitcher_id in [self.home_pitcher, self.away_pitcher]]
+        shares = np.array([stats[columns].values.astype(float) for stats, columns in players]).reshape(len(players), len(windows), -1)
+
+        self.rolling_columns = batter_columns + pitcher_columns
+        self.rolling_column_indexes = [self.feature_columns.get_loc(column) for column in self.rolling_columns]
+        if self.matchup_model is not None:
+            compiled = self.matchup_model.compiled
+            self.rolling_weights = compiled.weights[[compiled.feature_columns.index(column) for column in self.rolling_columns]]
+        return RollingStats(shares, windows, [constants.PLAY_TYPES.index(outcome) for outcome in self.outcome_names])
+
+    def _rolling_players(self, rows):
+        # The batter and opposing pitcher players of matchup rows
+        rows = np.asarray(rows)
+        return rows, 19 - rows // 9
+
+    def _model_input(self, features):
+        # The model pipeline selects its columns by name, so wrap the raw feature rows in a DataFrame (keeping them as object
+        # columns, like the original PA rows, which also skips pandas' per column type inference)
+        return pd.DataFrame(features, columns=self.feature_columns, dtype=object)
+
+    def _predict_states(self, rows, state, out=None, games=None):
+        # Outcome probabilities of the matchup rows with their STATE_COLUMNS values set to state
+        return self.predict_model_inputs(self._model_inputs(rows, state, out, games))
+
+    def _model_inputs(self, rows, state, out=None, games=None):
+        # What the model is fed for the matchup rows in the given states: the preprocessed rows when the pipeline is compiled,
+        # the raw feature rows otherwise (out is an optional buffer for those). With in game rolling stats, games are the batch
+        # games of the rows (game 0, the single game engine's, by default)
+        if self.rolling is not None:
+            games = np.zeros(len(rows), dtype=int) if games is None else games
+            batters, pitchers = self._rolling_players(rows)
+        if self.matchup_model is not None:
+            inputs = self.matchup_model.transform(rows, state)
+            if self.rolling is not None:
+                changes = np.hstack([self.rolling.share_changes(games, batters), self.rolling.share_changes(games, pitchers)])
+                inputs += changes @ self.rolling_weights
+            return inputs
+        features = np.take(self.matchup_features, rows, axis=0, out=out)
+        features[:, self.state_column_indexes] = state
+        if self.rolling is not None:
+            features[:, self.rolling_column_indexes] = np.hstack([self.rolling.current_shares(games, batters).reshape(len(rows), -1),
+                                                                  self.rolling.current_shares(games, pitchers).reshape(len(rows), -1)])
+        return features
+
+    def predict_model_inputs(self, inputs):
+        # Outcome probabilities of a stack of _model_inputs rows, which can come from any game sharing this PA_model and context
+        if self.matchup_model is not None:
+            return self.matchup_model.predict_transformed(inputs)
+        return self.PA_model.predict_proba(self._model_input(inputs))
 
-        # Insert the weather data
-        weather_dict = self.converted_weather
-        weather_series = pd.Series(weather_dict)
-        series = pd.concat([series, batter_stats, pitcher_stats, LA_stats, weather_series])
-        self.current_PA = series.to_frame().T
-        
-        # # Make sure all the columns are in the original order
-        self.current_PA = self.current_PA[self.daily_dataset.columns]
+    def make_PA_row(self, batter_id, pitcher_id):
+        # Point the current PA at the precompiled matchup row and write the game state into it in place
+        row = self.matchup_index[(batter_id, pitcher_id)]
+        self.current_matchup_row = row
+        self.current_PA = self.matchup_features[row:row + 1]
+        self.current_PA[0, self.state_column_indexes] = (self.on_3b, self.on_2b, self.on_1b, self.outs_when_up, self.inning,
+                                                         self.inning_topbot, self.bat_score, self.field_score)
            
     def update_current_PA(self, batter_id, pitcher_id):
         batter_stats = self.batter_stats[batter_id]
@@ -216,10 +356,56 @@ class GameSimulation():
         pitcher_stats.loc[pitcher_stats.index] = pitcher_stats
     
     def predict_PA(self):
-        probabilities = self.PA_model.predict_proba(self.current_PA).flatten()
-        outcome = np.random.choice(self.encoder.categories_[0], p=probabilities)
+        if self.outcome_probabilities is not None:
+            probabilities = self.outcome_probabilities[self.current_matchup_row, self.on_1b + 2*self.on_2b + 4*self.on_3b, self.outs_when_up,
+                                                       self.inning - 1, self._score_diff_index(self.bat_score - self.field_score)]
+        else:
+            probabilities = self._predict_states([self.current_matchup_row], self.current_PA[:, self.state_column_indexes]).flatten()
+        outcome = self.outcome_names[self.sampler.sample(probabilities)]
         return outcome
        
+    def compile_outcome_probabilities(self, max_score_diff=10):
+        '''Evaluates the PA model once for every reachable game state and stores the outcome probabilities in a dense tensor
+        indexed by (matchup row, bases, outs, inning - 1, score diff + max_score_diff). Bases are on_1b + 2*on_2b + 4*on_3b.
+        The model sees scores, not the diff, so each diff is fed as the leading team's margin over a score of 0, and diffs
+        past max_score_diff are clipped to it. Both simulate_game and simulate_games use the tensor once compiled'''
+        if self.rolling is not None:
+            raise ValueError('Outcome probabilities can not be compiled when the rolling stats are updated in game')
+        self.outcome_probabilities = self._state_outcome_probabilities(np.arange(-max_score_diff, max_score_diff + 1))
+        self.max_score_diff = max_score_diff
+        return self.outcome_probabilities
+
+    def _state_outcome_probabilities(self, score_diffs):
+        # Builds every (matchup row, bases, outs, inning, score diff) state for compile_outcome_probabilities/run_distributions
+        n_rows = len(self.matchup_features)
+        rows, bases, outs, innings, diffs = np.meshgrid(np.arange(n_rows), np.arange(8), np.arange(3), np.arange(1, self.innings_to_simulate + 1),
+                                                        score_diffs, indexing='ij')
+        rows, bases, outs, innings, diffs = rows.ravel(), bases.ravel(), outs.ravel(), innings.ravel(), diffs.ravel()
+
+        # Make a single model call for all of the states
+        state = np.column_stack([bases // 4, bases // 2 % 2, bases % 2, outs, innings,
+                                 (rows // 9 == AWAY).astype(int), # The away team bats in the top
+                                 np.maximum(diffs, 0), np.maximum(-diffs, 0)])
+        probabilities = self._predict_states(rows, state)
+
+        return probabilities.reshape(n_rows, 8, 3, self.innings_to_simulate, len(score_diffs), -1)
+
+    def run_distributions(self, max_runs=30):
+        '''Analytic alternative to simulating games when only the run totals are needed. Propagates the exact distribution
+        over the base/out states of every half inning (see markov.py), using the same runner rules as handle_outcome.
+        The score features are held at a tie throughout, since the runs of the two teams are tracked separately.
+        Returns {'home': P(runs), 'away': P(runs), 'home_win', 'away_win', 'tie'}, where the last run bin is max_runs or more'''
+        if self.outcome_probabilities is not None:
+            probabilities = self.outcome_probabilities[:, :, :, :, self._score_diff_index(0)]
+        else:
+            probabilities = self._state_outcome_probabilities(np.array([0]))[:, :, :, :, 0]
+        probabilities = probabilities.reshape(2, 9, *probabilities.shape[1:])
+        return game_run_distributions(probabilities, self.base_running, self.innings_to_simulate, max_runs)
+
+    def _score_diff_index(self, score_diff):
+        # Works on ints and arrays alike
+        return np.clip(score_diff, -self.max_score_diff, self.max_score_diff) + self.max_score_diff
+
     def simulate_game(self):
         # Define which batter is currently batting in the lineup
         self.lineup_tracker = {'home':1, 'away':1}
@@ -228,8 +414,10 @@ class GameSimulation():
         self.on_2b = 0
         self.on_3b = 0
         self.score_tracker = {'home':0, 'away':0}
-        self.batter_box_score = self._create_batter_boxscore_df(self.lineup_dict)
-        self.pitcher_box_score = self._create_pitcher_boxscore_df(self.lineup_dict)
+        self.batter_box.fill(0)
+        self.pitcher_box.fill(0)
+        if self.rolling is not None:
+            self.rolling.start(1)
 
         # Start with away team batting
         while self.inning <= self.innings_to_simulate:
@@ -257,8 +445,8 @@ class GameSimulation():
                 print(f"Score after inning {self.inning - 1}: Away - {self.score_tracker['away']}, Home - {self.score_tracker['home']}\n")
 
         # Finalize the boxscores (Aggregate some stats)
-        self.batter_box_score = self._finalize_box_score(self.batter_box_score, True)
-        self.pitcher_box_score = self._finalize_box_score(self.pitcher_box_score, False)
+        self.batter_box_score = self._finalize_box_score(self.batter_box, True)
+        self.pitcher_box_score = self._finalize_box_score(self.pitcher_box, False)
 
         return self.batter_box_score, self.pitcher_box_score, self.score_tracker
 
@@ -271,6 +459,8 @@ class GameSimulation():
             self.current_batter_id = batter_id
             pitcher_id = float(self.home_pitcher if team_type == 'away' else self.away_pitcher) # ONCE WE NEED TO UPDATE PITCHERS, WE WILL MOVE THIS TO SIM GAME AND CREATE A FUNCTION TO UPDATE PITCHER THAT SETS SELF.PITCHER ID AND MAKES A NEW ROW IN THE PITCHER BOX SCORE
             self.current_pitcher_id = pitcher_id
+            self.current_batter_slot = (HOME if team_type == 'home' else AWAY) * 9 + self.lineup_tracker[team_type] - 1
+            self.current_pitcher_slot = AWAY if team_type == 'home' else HOME
 
             # Create the at-bat row for the batter and pitcher
             self.make_PA_row(batter_id, pitcher_id)
@@ -292,202 +482,179 @@ class GameSimulation():
         self.on_3b = 0
         
     def handle_outcome(self, outcome, team_type):
-        if outcome == 'strikeout':
-            self.outs_when_up += 1  # Increment outs when batter is out
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['strikeouts', 'ABs', 'PAs'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['strikeouts', 'outs'])
-        elif outcome == 'field_out':
-            self.outs_when_up += 1  # Increment outs when batter is out
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['outs'])
-        elif outcome == 'walk':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['walks','PAs'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['walks_allowed'])
-
-            if self.on_1b == 0: # Bases Empty
-                self.on_1b == 1
-            elif self.on_2b == 0: # Just man on 1b
-                self.on_2b == 1
-            elif self.on_3b == 0: # Men on 1b and 2b
-                self.on_3b == 1
-            else: # Bases loaded
-                self.score_tracker[team_type] += 1
-        elif outcome == 'single':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs', 'singles'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['singles_allowed'])
-            self.handle_base_hit(1)  # Handle single (advance to 1st base)
-        elif outcome == 'double':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs', 'doubles'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['doubles_allowed'])
-            self.handle_base_hit(2)  # Handle double (advance to 2nd base)
-        elif outcome == 'home_run':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs', 'home_runs'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['home_runs_allowed'])
-            self.handle_home_run()  # Handle home run (score and reset bases)
-        elif outcome == 'error':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs'])
-            # Handle error (place batter on base without advancing outs)
-            error_value = np.random.random()
-            if error_value > 0.75:
-                self.handle_base_hit(2) # 2 base error with 25% chance
+        # Credit the counting stats of the outcome, then move the runners by the base running table
+        code = self.outcome_codes[outcome]
+        self.batter_box[self.current_batter_slot] += self.batter_outcome_increments[code]
+        self.pitcher_box[self.current_pitcher_slot] += self.pitcher_outcome_increments[code]
+        if self.rolling is not None:
+            self.rolling.update([0, 0], [self.current_batter_slot, 18 + self.current_pitcher_slot], [code, code])
+
+        bases = self.on_1b + 2*self.on_2b + 4*self.on_3b
+        probability, new_bases, new_outs, runs, rbis = pick_entry(self.base_running[code][bases][self.outs_when_up], self.sampler.random())
+        self.on_1b, self.on_2b, self.on_3b = new_bases % 2, new_bases // 2 % 2, new_bases // 4
+        self.outs_when_up = new_outs
+        self.score_tracker[team_type] += runs
+        if rbis:
+            self._credit_rbis(rbis)
+
+    ######################################################################################
+    # Batched (lockstep) simulation
+    ######################################################################################
+    def simulate_games(self, n_games):
+        '''Simulates n_games independent copies of the game in lockstep, one plate appearance per active game per step.
+        Returns a list of (batter_box_score, pitcher_box_score, score_tracker) tuples, one per game, matching simulate_game'''
+        self._run_games_batch(n_games)
+        return self._batch_box_scores_to_dfs()
+
+    def aggregate_games(self, n_games, batch_size=1000, aggregator=None):
+        '''Simulates n_games like simulate_games, batch_size at a time, feeding each batch into a BoxScoreAggregator instead
+        of building box score DataFrames, so memory stays flat however many games are run. Returns the aggregator'''
+        aggregator = aggregator if aggregator is not None else self.make_aggregator()
+        for start in range(0, n_games, batch_size):
+            aggregator.update_batch(*self.simulate_games_arrays(min(batch_size, n_games - start)))
+        return aggregator
+
+    def simulate_games_arrays(self, n_games):
+        '''simulate_games without the DataFrames: returns the (batter_box, pitcher_box, scores) arrays of the n_games, shaped
+        (n_games, batters, stats), (n_games, pitchers, stats) and (n_games, 2 (home, away)). Rows follow the box score
+        DataFrames and the stats are the make_aggregator ones (the box score stats plus total bases)'''
+        self._run_games_batch(n_games)
+        return self._batch_arrays()
+
+    async def simulate_games_arrays_async(self, n_games, broker):
+        '''simulate_games_arrays for running many games at once on an event loop: each step's model call is handed to broker
+        (an InferenceBroker), which batches it with the other games' calls. Only one of these can run per GameSimulation at
+        a time, and the box score DataFrames of the batch can be built afterwards with _batch_box_scores_to_dfs'''
+        self._start_games_batch(n_games)
+        while not self._done.all():
+            games, batting_team, slots = self._active_games_batch()
+            if self.outcome_probabilities is not None:
+                probabilities = self._predict_batch(games, batting_team, slots)
             else:
-                self.handle_base_hit(1) # 1 base error with 75% chance
-        elif outcome == 'double_play':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['outs'], value=2)
-            self.outs_when_up += 2  # Double play = two outs
-            if self.on_1b and self.on_2b:  # DP with runners on 1st and 2nd
-                self.on_1b = 0  # Remove runner on 1st
-                self.on_2b = 0  # Remove runner on 2nd
-            elif self.on_2b and self.on_3b:  # DP with runners on 2nd and 3rd
-                self.on_2b = 0  # Remove runner on 2nd
-                self.on_3b = 0  # Remove runner on 3rd
-            elif self.on_1b and self.on_3b:  # NOT adjacent, remove 1st base only
-                self.on_1b = 0  # Remove runner on 1st
-                if self.outs_when_up < 3: # Then the runner on 3b can score
-                    self.on_3b = 0
-                    self.score_tracker[team_type] += 1
-            else:  # If only one runner is on base, remove them
-                if self.on_3b:
-                    self.on_3b = 0
-                elif self.on_2b:
-                    self.on_2b = 0
-                elif self.on_1b:
-                    self.on_1b = 0
-        elif outcome == 'sacrifice':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'sacs'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['outs'])
-            # Advance all runners by one base
-            self.outs_when_up += 1
-            if self.on_3b:
-                self.on_3b = 0
-                self.score_tracker[team_type] += 1
-            if self.on_2b:
-                self.on_2b = 0
-                self.on_3b = 1
-            if self.on_1b:
-                self.on_1b = 0
-                self.on_2b = 1
-        elif outcome == 'triple':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs', 'triples'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['triples_allowed'])
-            self.handle_base_hit(3)  # Handle triple (advance to 3rd base)
-        elif outcome == 'fielders_choice':
-            self._update_boxscore(self.batter_box_score, self.current_batter_id, ['PAs', 'ABs'])
-            self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['outs'], value=1)
-            self.outs_when_up += 1  # One out recorded
-
-            # Lead runner is out, other runners advance
-            if self.on_3b:  # Lead runner on 3rd is out
-                self.on_3b = 0
-                if self.on_2b: # if runner on 2, he advances
-                    self.on_2b = 0
-                    self.on_3b = 1
-                if self.on_1b: # if runner on 1, he advances
-                    self.on_1b = 0
-                    self.on_2b = 1
-            elif self.on_2b:  # Lead runner on 2nd is out
-                self.on_2b = 0
-                self.on_3b = 1  # Runner from 1B advances to 2B
-                if self.on_1b: # if runner on 1, he advances
-                    self.on_1b = 0
-                    self.on_2b = 1
-            self.on_1b = 1 #Batter takes 1B
-
-    def handle_base_hit(self, bases):
-        # Handle moving runners based on the type of base hit (single, double, triple)
-        if bases == 1:
-            self.on_1b = 1  # Batter advances to 1st base
-        elif bases == 2:
-            self.on_2b = 1  # Batter advances to 2nd base
-        elif bases == 3:
-            self.on_3b = 1  # Batter advances to 3rd base
-
-        # Move any existing runners on base
-        self.advance_runners(bases)
-
-    def advance_runners(self, bases):
-        # Update base runners based on the type of hit
-        # Update base runners based on the type of hit
-        if bases == 1:  # Single
-            if self.on_3b:
-                self.score_tracker[self.batting_team] += 1  # Run scores from 3rd base
-                self.on_3b = 0
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-
-            runner_on_2b_scores = self.on_2b and random.random() < 0.62  # 62% chance to score
-            runner_on_1b_scores = self.on_1b and random.random() < 0.01  # 1% chance to score
-            runner_on_1b_advances = self.on_1b and runner_on_2b_scores and random.random() < 0.40  # Can only advance if 2nd scores
-
-            if runner_on_2b_scores:
-                self.score_tracker[self.batting_team] += 1  # Score from 2nd
-                self.on_2b = 0  # Clear 2nd base
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-
-            if runner_on_1b_scores:
-                self.score_tracker[self.batting_team] += 1  # Score from 1st
-                self.on_1b = 0  # Clear 1st base
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-            elif runner_on_1b_advances:
-                self.on_3b = self.on_1b  # Move to 3rd
-                self.on_1b = 0  # Clear 1st base
-            else:
-                self.on_2b = self.on_1b  # Normal advance to 2nd
-
-            self.on_1b = 1  # Batter takes 1st base
-
-        elif bases == 2:  # Double
-            if self.on_3b:
-                self.score_tracker[self.batting_team] += 1  # Run scores from 3rd base
-                self.on_3b = 0
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-
-            if self.on_2b:
-                self.score_tracker[self.batting_team] += 1  # Run scores from 2nd base
-                self.on_2b = 0  # Clear 2nd base since they scored
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-
-            runner_on_1b_scores = self.on_1b and random.random() < 0.38  # 38% chance to score from 1st
-
-            if runner_on_1b_scores:
-                self.score_tracker[self.batting_team] += 1  # Runner from 1st scores
-                self.on_1b = 0  # Clear 1st base
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-            else:
-                self.on_3b = self.on_1b  # Move runner from 1st to 3rd
-
-            self.on_2b = 1  # Batter takes 2nd base
-            self.on_1b = 0  # 1st base remains empty after a double
-
-        elif bases == 3:  # Triple
-            if self.on_3b != 0:
-                self.score_tracker[self.batting_team] += 1  # Run scores from 3rd base
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-            if self.on_2b != 0:
-                self.score_tracker[self.batting_team] += 1  # Run scores from 2nd base
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-            if self.on_1b != 0:
-                self.score_tracker[self.batting_team] += 1
-                self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'])
-                self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'])
-            self.on_3b = 1
-            self.on_2b = 0
-            self.on_1b = 0
-
-    def handle_home_run(self):
-        # Home run: Score the batter and clear the bases
-        self.score_tracker[self.batting_team] += sum([self.on_1b, self.on_2b, self.on_3b, 1])
-        self.on_3b = 0
-        self.on_2b = 0
-        self.on_1b = 0
-
-        self._update_boxscore(self.batter_box_score, self.current_batter_id, ['rbis'], value=sum([self.on_1b, self.on_2b, self.on_3b, 1]))
-        self._update_boxscore(self.pitcher_box_score, self.current_pitcher_id, ['total_runs_allowed'], value=sum([self.on_1b, self.on_2b, self.on_3b, 1]))
+                probabilities = await broker.predict_proba(self._model_inputs(*self._batch_states(games, batting_team, slots), games=games))
+            self._step_games_batch(games, batting_team, slots, probabilities)
+        return self._batch_arrays()
+
+    def _batch_arrays(self):
+        batter_box, pitcher_box = self._finalized_stats(self._batch_batter_box[:, self._batter_box_rows], self._batch_pitcher_box)
+        return batter_box, pitcher_box, self._scores.copy()
+
+    def make_aggregator(self, max_value=40):
+        # An empty BoxScoreAggregator laid out like this game's box scores
+        return BoxScoreAggregator(self._batter_box_template.drop(columns=BATTER_STATS), BATTER_STATS + ['total_bases'],
+                                  self._pitcher_box_template.drop(columns=PITCHER_STATS), PITCHER_STATS + ['total_bases_allowed'], max_value)
+
+    def _finalized_stats(self, batter_box, pitcher_box):
+        # Array version of _finalize_box_score over a batch of box scores: fills in the hits and appends the total bases
+        batter_box, pitcher_box = batter_box.copy(), pitcher_box.copy()
+        singles, doubles, triples, home_runs = (batter_box[..., BATTER_STAT_INDEX[stat]] for stat in ['singles', 'doubles', 'triples', 'home_runs'])
+        batter_box[..., BATTER_STAT_INDEX['hits']] = singles + doubles + triples + home_runs
+        batter_box = np.concatenate([batter_box, (singles + 2*doubles + 3*triples + 4*home_runs)[..., None]], axis=-1)
+
+        singles, doubles, triples, home_runs = (pitcher_box[..., PITCHER_STAT_INDEX[stat]] for stat in
+                                                ['singles_allowed', 'doubles_allowed', 'triples_allowed', 'home_runs_allowed'])
+        pitcher_box[..., PITCHER_STAT_INDEX['hits_allowed']] = singles + doubles + triples + home_runs
+        pitcher_box = np.concatenate([pitcher_box, (singles + 2*doubles + 3*triples + 4*home_runs)[..., None]], axis=-1)
+        return batter_box, pitcher_box
+
+    def _run_games_batch(self, n_games):
+        # Runs the lockstep engine, leaving the final state and box scores of the n_games in the batch arrays
+        self._start_games_batch(n_games)
+        while not self._done.all():
+            games, batting_team, slots = self._active_games_batch()
+            # One model call for every active game
+            self._step_games_batch(games, batting_team, slots, self._predict_batch(games, batting_team, slots))
+
+    def _start_games_batch(self, n_games):
+        self._batch_features = np.empty((n_games, len(self.feature_columns)), dtype=object)
+
+        # Per game state. Lineup slots and scores are indexed by HOME/AWAY
+        self._inning = np.ones(n_games, dtype=int)
+        self._half = np.zeros(n_games, dtype=int) # 0 for top 1 for bottom
+        self._outs = np.zeros(n_games, dtype=int)
+        self._bases = np.zeros((n_games, 3), dtype=int) # 1b, 2b, 3b
+        self._scores = np.zeros((n_games, 2), dtype=int)
+        self._half_start_scores = np.zeros((n_games, 2), dtype=int) # bat/fld scores are only refreshed at the start of each half inning
+        self._lineup_slots = np.ones((n_games, 2), dtype=int)
+        self._done = np.zeros(n_games, dtype=bool)
+        self._batch_batter_box = np.zeros((n_games, 18, len(BATTER_STATS)), dtype=int)
+        self._batch_pitcher_box = np.zeros((n_games, 2, len(PITCHER_STATS)), dtype=int)
+        if self.rolling is not None:
+            self.rolling.start(n_games)
+
+    def _active_games_batch(self):
+        # The games still going, the team batting in each and its lineup slot due up
+        games = np.flatnonzero(~self._done)
+        batting_team = np.where(self._half[games] == 0, AWAY, HOME)
+        return games, batting_team, self._lineup_slots[games, batting_team]
+
+    def _step_games_batch(self, games, batting_team, slots, probabilities):
+        # Draw the outcomes by inverse CDF and play them out
+        outcomes = self.sampler.sample(probabilities)
+        self._apply_outcomes_batch(games, outcomes, batting_team, slots)
+        if self.rolling is not None:
+            batters, pitchers = self._rolling_players(batting_team * 9 + slots - 1)
+            self.rolling.update(np.concatenate([games, games]), np.concatenate([batters, pitchers]), np.concatenate([outcomes, outcomes]))
+
+        # Move to the next batter (circular lineup)
+        next_slots = (slots + 1) % 9
+        next_slots[next_slots == 0] += 1
+        self._lineup_slots[games, batting_team] = next_slots
+
+        self._end_half_innings_batch(games[self._outs[games] >= 3])
+
+    def _predict_batch(self, games, batting_team, slots):
+        if self.outcome_probabilities is not None:
+            bases = self._bases[games, 0] + 2*self._bases[games, 1] + 4*self._bases[games, 2]
+            score_diffs = self._half_start_scores[games, batting_team] - self._half_start_scores[games, 1 - batting_team]
+            return self.outcome_probabilities[batting_team * 9 + slots - 1, bases, self._outs[games], self._inning[games] - 1,
+                                              self._score_diff_index(score_diffs)]
+
+        # Matchup rows are gathered into the preallocated buffer if needed
+        return self._predict_states(*self._batch_states(games, batting_team, slots), out=self._batch_features[:len(games)], games=games)
+
+    def _batch_states(self, games, batting_team, slots):
+        # The matchup row and game state columns of every active game
+        state = np.column_stack([self._bases[games, 2], self._bases[games, 1], self._bases[games, 0], self._outs[games], self._inning[games],
+                                 1 - self._half[games], self._half_start_scores[games, batting_team], self._half_start_scores[games, 1 - batting_team]])
+        return batting_team * 9 + slots - 1, state
+
+    def _apply_outcomes_batch(self, games, outcomes, batting_team, slots):
+        # Vectorized handle_outcome: one uniform per game picks its base running entry, which is then applied to every active game at once
+        table = self.base_running_arrays
+        bases = self._bases[games, 0] + 2*self._bases[games, 1] + 4*self._bases[games, 2]
+        outs = self._outs[games]
+        cumulative = table['cumulative'][outcomes, bases, outs]
+        entries = (cumulative <= self.sampler.uniforms(len(games))[:, None]).sum(axis=1)
+        entry = (outcomes, bases, outs, entries)
+
+        new_bases, runs, rbis = table['bases'][entry], table['runs'][entry], table['rbis'][entry]
+        self._bases[games] = np.column_stack([new_bases % 2, new_bases // 2 % 2, new_bases // 4])
+        self._outs[games] = table['outs'][entry]
+        self._scores[games, batting_team] += runs
+
+        # Update the box scores with the counting stats of each outcome plus the rbis/runs allowed
+        batter_update = self.batter_outcome_increments[outcomes]
+        batter_update[:, BATTER_STAT_INDEX['rbis']] += rbis
+        pitcher_update = self.pitcher_outcome_increments[outcomes]
+        pitcher_update[:, PITCHER_STAT_INDEX['total_runs_allowed']] += rbis
+        self._batch_batter_box[games, batting_team * 9 + slots - 1] += batter_update
+        self._batch_pitcher_box[games, 1 - batting_team] += pitcher_update
+
+    def _end_half_innings_batch(self, games):
+        # Reset the bases/outs and move each game to its next half inning, skipping the home half from the 9th on
+        self._outs[games] = 0
+        self._bases[games] = 0
+        to_bottom = (self._half[games] == 0) & (self._inning[games] < 9)
+        self._inning[games] += ~to_bottom
+        self._half[games] = to_bottom
+        self._half_start_scores[games] = self._scores[games]
+        self._done[games] = self._inning[games] > self.innings_to_simulate
+
+    def _batch_box_scores_to_dfs(self):
+        results = []
+        for game in range(len(self._done)):
+            score_tracker = {'home': int(self._scores[game, HOME]), 'away': int(self._scores[game, AWAY])}
+            results.append((self._finalize_box_score(self._batch_batter_box[game], True),
+                            self._finalize_box_score(self._batch_pitcher_box[game], False), score_tracker))
+        return results
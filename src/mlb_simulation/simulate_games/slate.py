@@ -0,0 +1,123 @@
+import pandas as pd
+import numpy as np
+import pickle as pkl
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from simulate import GameSimulation
+from sampling import OutcomeSampler
+from daily_context import DailyContext
+from train_models.native import NativePredictor
+
+
+MODEL_PATH = '../train_models/data/models/XGBoost_model.pkl'
+ENCODER_PATH = '../train_models/data/y-label_encoder.pkl'
+
+# Per worker process state: the model/encoder are loaded once by the initializer, the slate's DailyContext is handed over
+# (inherited without copying when the workers are forked) and each game's GameSimulation (plus its compiled probabilities)
+# is reused by every batch of that game the worker picks up
+_worker_state = {}
+
+
+def _init_worker(model_path, encoder_path, context):
+    if model_path.endswith('.npz'):
+        # Exported by export_native_model, so the workers don't have to import xgboost or TensorFlow
+        _worker_state['model'] = NativePredictor.load(model_path)
+    else:
+        with open(model_path, 'rb') as fpath:
+            _worker_state['model'] = pkl.load(fpath)
+    with open(encoder_path, 'rb') as fpath:
+        _worker_state['encoder'] = pkl.load(fpath)
+    _worker_state['context'] = context
+    _worker_state['games'] = {}
+
+
+def _simulate_batch(game_key, date, lineup, innings_to_simulate, compile, aggregate, n_sims, seed):
+    games = _worker_state['games']
+    if game_key not in games:
+        game = GameSimulation(date, lineup['home_team'], lineup, _worker_state['model'], _worker_state['encoder'],
+                              innings_to_simulate=innings_to_simulate, context=_worker_state['context'])
+        if compile:
+            game.compile_outcome_probabilities()
+        games[game_key] = game
+
+    # Draw the batch from its own stream
+    games[game_key].sampler = OutcomeSampler(seed)
+    if aggregate:
+        return games[game_key].aggregate_games(n_sims)
+    return games[game_key].simulate_games(n_sims)
+
+
+def _batch_sizes(n_sims, batch_size):
+    n_batches = -(-n_sims // batch_size)
+    return [min(batch_size, n_sims - i * batch_size) for i in range(n_batches)]
+
+
+def _merge_batches(results, aggregate):
+    if aggregate:
+        # Fold the batch aggregators into the first one
+        aggregator = results[0]
+        for result in results[1:]:
+            aggregator.merge(result)
+        return aggregator
+
+    # Stack every simulated box score of a game, numbering the sims in batch order
+    batter_box_scores, pitcher_box_scores, scores = [], [], []
+    for sim, (batter_box_score, pitcher_box_score, score_tracker) in enumerate(result for batch in results for result in batch):
+        batter_box_scores.append(batter_box_score.assign(sim=sim))
+        pitcher_box_scores.append(pitcher_box_score.assign(sim=sim))
+        scores.append(score_tracker)
+
+    return {'batter_box_scores': pd.concat(batter_box_scores).reset_index(drop=False),
+            'pitcher_box_scores': pd.concat(pitcher_box_scores).reset_index(drop=False),
+            'scores': pd.DataFrame(scores).rename_axis('sim')}
+
+
+def shard_seed(seed, game_index, batch_index):
+    '''The SeedSequence of one (game, batch) shard of a slate: the same stream as spawning a child per game from seed and
+    a child per batch from that, but any shard can be built on its own (on any worker or node) without the others.
+    seed is a SeedSequence or anything SeedSequence takes'''
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (game_index, batch_index), pool_size=root.pool_size)
+
+
+def slate_shards(lineups, n_sims=1000, batch_size=250):
+    '''Every (game key, batch index) shard of a slate, in order'''
+    game_lineups = lineups if isinstance(lineups, dict) else dict(enumerate(lineups))
+    return [(game_key, batch) for game_key in game_lineups for batch in range(len(_batch_sizes(n_sims, batch_size)))]
+
+
+def simulate_shards(date, lineups, shards, n_sims=1000, batch_size=250, innings_to_simulate=9, seed=None, compile=True,
+                    max_workers=None, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, context=None, aggregate=False):
+    '''Runs only the given (game key, batch index) shards of the simulate_slate call with the same arguments, e.g. to
+    re-run a failed shard or to split a slate across nodes. Each shard draws from shard_seed(seed, game position, batch),
+    so its result is bit identical to the same shard of the full slate (seed has to be set for that, otherwise the root
+    entropy is fresh on every call). Returns {(game key, batch index): batch result}'''
+    context = context if context is not None else DailyContext(date)
+    game_lineups = lineups if isinstance(lineups, dict) else dict(enumerate(lineups))
+    game_indexes = {game_key: i for i, game_key in enumerate(game_lineups)}
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    sizes = _batch_sizes(n_sims, batch_size)
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(model_path, encoder_path, context)) as pool:
+        futures = {(game_key, batch): pool.submit(_simulate_batch, game_key, date, game_lineups[game_key], innings_to_simulate, compile,
+                                                  aggregate, sizes[batch], shard_seed(root, game_indexes[game_key], batch))
+                   for game_key, batch in shards}
+        return {shard: future.result() for shard, future in futures.items()}
+
+
+def simulate_slate(date, lineups, n_sims=1000, batch_size=250, innings_to_simulate=9, seed=None, compile=True,
+                   max_workers=None, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, context=None, aggregate=False):
+    '''Simulates every game of a slate on a process pool, splitting each game's n_sims into batches of batch_size.
+    lineups is the lineups['lineups'] dict from mlb_scrape (or a list of lineup dicts). Every (game, batch) shard gets its own
+    stream derived from seed (see shard_seed), so the results only depend on seed and batch_size, not on max_workers or
+    on which process ran which shard.
+    The date's DailyContext is loaded once here (unless one is passed in) and shared with every worker.
+    Returns a dict keyed like lineups with each game's stacked batter/pitcher box scores and final scores, or with each
+    game's BoxScoreAggregator when aggregate is True (which keeps memory flat for large n_sims)'''
+    game_lineups = lineups if isinstance(lineups, dict) else dict(enumerate(lineups))
+    results = simulate_shards(date, game_lineups, slate_shards(game_lineups, n_sims, batch_size), n_sims, batch_size, innings_to_simulate,
+                              seed, compile, max_workers, model_path, encoder_path, context, aggregate)
+    return {game_key: _merge_batches([results[(game_key, batch)] for batch in range(len(_batch_sizes(n_sims, batch_size)))], aggregate)
+            for game_key in game_lineups}
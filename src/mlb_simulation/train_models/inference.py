@@ -0,0 +1,179 @@
+import numpy as np
+from scipy import sparse
+from sklearn.pipeline import Pipeline
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import StandardScaler, OneHotEncoder
+from sklearn.decomposition import PCA
+
+
+def _steps(transformer):
+    # A ColumnTransformer entry is either a single transformer or a Pipeline of them
+    return [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer]
+
+
+def _fold_linear_steps(steps, n_columns):
+    # Folds a chain of StandardScaler/PCA steps into a single x @ weights + bias
+    weights, bias = np.eye(n_columns), np.zeros(n_columns)
+    for step in steps:
+        if isinstance(step, StandardScaler):
+            mean = step.mean_ if step.with_mean else 0
+            scale = step.scale_ if step.with_std else 1
+            weights, bias = weights / scale, (bias - mean) / scale
+        elif isinstance(step, PCA):
+            components = step.components_.T
+            if step.whiten:
+                components = components / np.sqrt(step.explained_variance_)
+            weights, bias = weights @ components, (bias - step.mean_) @ components
+        else:
+            raise ValueError(f'Can not fold a {type(step).__name__} into the linear preprocessing')
+    return weights, bias
+
+
+class CompiledPipeline():
+    """
+    The fitted preprocessing of an ml_pipe pipeline as plain NumPy arrays. StandardScaler and PCA are linear, so the numeric
+    transformer is folded into one weights matrix (with a row per input column) plus a bias, and the one hot encoded columns
+    become a list of category lookups. Predictions feed the pipeline's final estimator directly.
+
+    Args:
+        pipeline (Pipeline): A fitted ml_pipe(model) pipeline, ColumnTransformer first and the model last.
+        feature_columns (list): The column order of the feature rows that will be passed in.
+
+    Raises:
+        ValueError: If the preprocessing has a step that is not a StandardScaler, PCA, OneHotEncoder or passthrough.
+
+    Example:
+        compiled = CompiledPipeline(PA_model, daily_dataset.columns)
+        probabilities = compiled.predict_proba(feature_rows)
+    """
+    def __init__(self, pipeline, feature_columns):
+        if not isinstance(pipeline, Pipeline) or not isinstance(pipeline.steps[0][1], ColumnTransformer):
+            raise ValueError('Only pipelines that start with a ColumnTransformer can be compiled')
+        preprocessor = pipeline.steps[0][1]
+        self.estimator = pipeline.steps[-1][1] if len(pipeline.steps) > 1 else None
+        self.feature_columns = list(feature_columns)
+        self.sparse_output = preprocessor.sparse_output_
+
+        blocks = [(transformer, self._column_indexes(preprocessor, columns)) for _, transformer, columns in preprocessor.transformers_
+                  if not isinstance(transformer, str) or transformer == 'passthrough']
+        blocks = [(transformer, columns) for transformer, columns in blocks if len(columns) > 0]
+
+        # Lay the transformers' outputs side by side, like the ColumnTransformer does
+        linear_blocks, self.categorical = [], [] # categorical holds (feature index, output offset, categories)
+        self.n_outputs = 0
+        for transformer, columns in blocks:
+            steps = [] if transformer == 'passthrough' else _steps(transformer)
+            if len(steps) == 1 and isinstance(steps[0], OneHotEncoder):
+                encoder = steps[0]
+                if encoder.drop_idx_ is not None or encoder.min_frequency is not None or encoder.max_categories is not None:
+                    raise ValueError('Only OneHotEncoders without dropped or infrequent categories can be compiled')
+                for column, categories in zip(columns, encoder.categories_):
+                    self.categorical.append((column, self.n_outputs, {category: i for i, category in enumerate(categories)}))
+                    self.n_outputs += len(categories)
+            else:
+                weights, bias = _fold_linear_steps(steps, len(columns))
+                linear_blocks.append((columns, self.n_outputs, weights, bias))
+                self.n_outputs += weights.shape[1]
+
+        # The linear part of every output, with a (zero) row for each feature column
+        self.weights = np.zeros((len(self.feature_columns), self.n_outputs))
+        self.bias = np.zeros(self.n_outputs)
+        for columns, offset, weights, bias in linear_blocks:
+            self.weights[columns, offset:offset + weights.shape[1]] += weights
+            self.bias[offset:offset + weights.shape[1]] = bias
+        self.linear_columns = np.flatnonzero(self.weights.any(axis=1))
+
+    def _column_indexes(self, preprocessor, columns):
+        # The fitted columns of a transformer are names (from make_column_selector) or positions in the fitted frame
+        if isinstance(columns, slice) or np.asarray(columns).dtype.kind in 'bi':
+            names = np.atleast_1d(np.asarray(preprocessor.feature_names_in_)[columns])
+        else:
+            names = np.atleast_1d(columns)
+        missing = [name for name in names if name not in self.feature_columns]
+        if missing:
+            raise ValueError(f'The pipeline uses columns that are not in feature_columns: {missing}')
+        return [self.feature_columns.index(name) for name in names]
+
+    def transform(self, features):
+        """
+        Same output as the pipeline's preprocessor for rows in feature_columns order (always dense).
+
+        Args:
+            features (np.ndarray): 2D array of feature rows, object dtype is fine.
+
+        Returns:
+            np.ndarray: The preprocessed rows.
+        """
+        transformed = features[:, self.linear_columns].astype(float) @ self.weights[self.linear_columns] + self.bias
+        for column, offset, categories in self.categorical:
+            # Unknown categories get no column, like handle_unknown='ignore'
+            codes = np.array([categories.get(value, -1) for value in features[:, column]])
+            known = codes >= 0
+            transformed[np.flatnonzero(known), offset + codes[known]] = 1
+        return transformed
+
+    def partial_projection(self, values, columns):
+        """
+        The contribution of a subset of the columns to the linear outputs (without the bias). The projection of a full row is
+        the bias plus the sum of the partial projections of any split of its columns, so the parts that are fixed for a
+        batter, a pitcher or a day can be computed once and added up later.
+
+        Args:
+            values (np.ndarray): 2D array with the values of columns for each row.
+            columns (list): The names of the columns in values.
+
+        Returns:
+            np.ndarray: The partial projection of each row.
+        """
+        indexes = [self.feature_columns.index(column) for column in columns]
+        return np.asarray(values, dtype=float) @ self.weights[indexes]
+
+    def predict_proba(self, features):
+        return self._predict_transformed(self.transform(features))
+
+    def _predict_transformed(self, transformed):
+        if self.sparse_output:
+            # The estimator was fit on the sparse output, where zeros are left out
+            transformed = sparse.csr_matrix(transformed)
+        return self.estimator.predict_proba(transformed)
+
+    def bind(self, matchup_features, state_columns, columns=None):
+        """
+        Precomputes everything but the game state for a fixed set of feature rows, for example every batter vs starter
+        matchup of a game. The state columns have to be numeric.
+
+        Args:
+            matchup_features (np.ndarray): 2D array of feature rows.
+            state_columns (list): The columns that change from one prediction to the next.
+            columns (list, optional): The column order of matchup_features, if it isn't feature_columns.
+
+        Returns:
+            BoundPipeline: Predicts from a matchup row index and the state column values.
+        """
+        state_indexes = [self.feature_columns.index(column) for column in state_columns]
+        if any(column in state_indexes for column, _, _ in self.categorical):
+            raise ValueError('Only numeric state columns can be bound')
+        fixed_features = np.array(matchup_features, dtype=object)
+        if columns is not None:
+            columns = list(columns)
+            fixed_features = fixed_features[:, [columns.index(column) for column in self.feature_columns]]
+        fixed_features[:, state_indexes] = 0
+        return BoundPipeline(self, self.transform(fixed_features), self.weights[state_indexes])
+
+
+class BoundPipeline():
+    # A CompiledPipeline with the fixed part of its rows already transformed, see CompiledPipeline.bind
+    def __init__(self, compiled, fixed, state_weights):
+        self.compiled = compiled
+        self.fixed = fixed
+        self.state_weights = state_weights
+
+    def transform(self, rows, state):
+        return self.fixed[rows] + np.asarray(state, dtype=float) @ self.state_weights
+
+    def predict_proba(self, rows, state):
+        return self.predict_transformed(self.transform(rows, state))
+
+    def predict_transformed(self, transformed):
+        # Outcome probabilities of rows already through transform, which callers can adjust in between (e.g. in game rolling stats)
+        return self.compiled._predict_transformed(transformed)
@@ -0,0 +1,304 @@
+import json
+import pickle as pkl
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.linear_model import LogisticRegression
+from sklearn.neural_network import MLPClassifier
+
+from train_models.inference import CompiledPipeline
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _softmax(x):
+    exp = np.exp(x - x.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _one_vs_rest(x):
+    probabilities = _sigmoid(x)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+def _binary(x):
+    # A single logistic output is the chance of the second class
+    return np.column_stack([1 - _sigmoid(x[:, 0]), _sigmoid(x[:, 0])])
+
+
+ACTIVATIONS = {'relu': lambda x: np.maximum(x, 0), 'tanh': np.tanh, 'logistic': _sigmoid, 'sigmoid': _sigmoid,
+               'identity': lambda x: x, 'linear': lambda x: x, 'softmax': _softmax, 'one_vs_rest': _one_vs_rest, 'binary': _binary}
+
+
+def _export_logistic(estimator):
+    # Scored as a single dense layer
+    if estimator.coef_.shape[0] == 1:
+        output = 'binary'
+    elif getattr(estimator, 'multi_class', 'auto') == 'ovr' or (getattr(estimator, 'multi_class', 'auto') == 'auto' and estimator.solver == 'liblinear'):
+        output = 'one_vs_rest'
+    else:
+        output = 'softmax'
+    return {'kind': 'layers', 'activations': [output]}, {'layer_0_weights': estimator.coef_.T, 'layer_0_bias': estimator.intercept_}
+
+
+def _export_mlp(estimator):
+    activations = [estimator.activation] * (len(estimator.coefs_) - 1) + ['binary' if estimator.out_activation_ == 'logistic' else estimator.out_activation_]
+    arrays = {}
+    for i, (weights, bias) in enumerate(zip(estimator.coefs_, estimator.intercepts_)):
+        arrays[f'layer_{i}_weights'], arrays[f'layer_{i}_bias'] = weights, bias
+    return {'kind': 'layers', 'activations': activations}, arrays
+
+
+def _export_keras(model):
+    # Dense layers are kept as is, batch normalization becomes a dense layer with a diagonal weights matrix
+    activations, arrays = [], {}
+    for layer in model.layers:
+        layer_type = type(layer).__name__
+        weights = layer.get_weights()
+        if layer_type in ('InputLayer', 'Dropout'):
+            continue
+        elif layer_type == 'Dense':
+            kernel = weights[0]
+            bias = weights[1] if len(weights) > 1 else np.zeros(kernel.shape[1])
+            activation = layer.get_config()['activation']
+        elif layer_type == 'BatchNormalization':
+            config = layer.get_config()
+            gamma = weights.pop(0) if config['scale'] else 1
+            beta = weights.pop(0) if config['center'] else 0
+            moving_mean, moving_variance = weights
+            scale = gamma / np.sqrt(moving_variance + config['epsilon'])
+            kernel, bias, activation = np.diag(scale), beta - moving_mean * scale, 'linear'
+        else:
+            raise ValueError(f'Can not export a {layer_type} layer, only Dense, Dropout and BatchNormalization layers are supported')
+        if activation not in ACTIVATIONS:
+            raise ValueError(f'Can not export the {activation} activation')
+        arrays[f'layer_{len(activations)}_weights'], arrays[f'layer_{len(activations)}_bias'] = kernel, bias
+        activations.append(activation)
+    return {'kind': 'layers', 'activations': activations}, arrays
+
+
+def _export_xgboost(estimator):
+    import xgboost
+
+    booster = estimator.get_booster()
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+    objective = learner['objective']['name']
+    if objective not in ('multi:softprob', 'multi:softmax', 'binary:logistic') or learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f'Can not export a {learner["gradient_booster"]["name"]} booster with a {objective} objective')
+
+    # Only the trees up to the best iteration are used by predict_proba when the model was early stopped
+    n_rounds = booster.num_boosted_rounds()
+    trees = learner['gradient_booster']['model']['trees']
+    tree_info = learner['gradient_booster']['model']['tree_info']
+    try:
+        n_rounds = estimator.best_iteration + 1
+    except AttributeError:
+        pass
+    n_trees = n_rounds * (len(trees) // booster.num_boosted_rounds())
+    trees, tree_info = trees[:n_trees], tree_info[:n_trees]
+
+    # Flatten every tree into one set of node arrays. XGBoost adds both children of a split together, so the right child is
+    # always the left one + 1. Leaves point back to themselves with an infinite threshold so that walking down a fixed number
+    # of levels leaves every row on its leaf, and their value is kept in split_conditions
+    feature, threshold, left, default_right, leaf_value, roots, depth = [], [], [], [], [], [], 0
+    for tree in trees:
+        left_children, right_children = np.array(tree['left_children']), np.array(tree['right_children'])
+        is_leaf = left_children == -1
+        if any(tree['split_type']) or np.any(right_children[~is_leaf] != left_children[~is_leaf] + 1):
+            raise ValueError('Can only export trees of numeric splits with adjacent children')
+        offset = sum(len(nodes) for nodes in feature)
+        nodes = np.arange(len(left_children))
+        feature.append(np.where(is_leaf, 0, tree['split_indices']))
+        threshold.append(np.where(is_leaf, np.inf, tree['split_conditions']))
+        left.append(offset + np.where(is_leaf, nodes, left_children))
+        default_right.append(~np.array(tree['default_left'], dtype=bool) & ~is_leaf)
+        leaf_value.append(np.where(is_leaf, tree['split_conditions'], 0))
+        roots.append(offset)
+
+        stack = [(0, 0)]
+        while stack:
+            node, node_depth = stack.pop()
+            depth = max(depth, node_depth)
+            if not is_leaf[node]:
+                stack += [(left_children[node], node_depth + 1), (right_children[node], node_depth + 1)]
+
+    n_classes = max(int(learner['learner_model_param']['num_class']), 1)
+    tree_class = np.zeros((len(trees), n_classes))
+    tree_class[np.arange(len(trees)), tree_info] = 1
+    arrays = {'feature': np.concatenate(feature), 'threshold': np.concatenate(threshold).astype(np.float32), 'left': np.concatenate(left),
+              'default_right': np.concatenate(default_right), 'leaf_value': np.concatenate(leaf_value), 'roots': np.array(roots),
+              'tree_class': tree_class, 'intercept': np.zeros(n_classes)}
+
+    # The base score is whatever is left of the booster's margin once the trees are taken out
+    zeros = np.zeros((1, int(learner['learner_model_param']['num_feature'])))
+    margin = booster.predict(xgboost.DMatrix(zeros), output_margin=True, iteration_range=(0, n_rounds)).reshape(1, -1)
+    arrays['intercept'] = (margin - _tree_margins(arrays, depth, zeros))[0]
+
+    output = 'binary' if objective == 'binary:logistic' else 'softmax'
+    return {'kind': 'trees', 'max_depth': int(depth), 'output': output}, arrays
+
+
+def _tree_margins(arrays, max_depth, transformed, block_size=512):
+    # Walks a block of rows down every tree at once, a level at a time. XGBoost compares in float32 and sends missing values
+    # the default way
+    margins = []
+    for start in range(0, len(transformed), block_size):
+        values = transformed[start:start + block_size].astype(np.float32)
+        missing = np.isnan(values).any()
+        flat_values, row_starts = values.ravel(), (np.arange(len(values)) * values.shape[1])[:, None]
+        nodes = np.broadcast_to(arrays['roots'], (len(values), len(arrays['roots'])))
+        for _ in range(max_depth):
+            feature_values = flat_values[row_starts + arrays['feature'][nodes]]
+            go_right = feature_values >= arrays['threshold'][nodes]
+            if missing:
+                go_right = np.where(np.isnan(feature_values), arrays['default_right'][nodes], go_right)
+            nodes = arrays['left'][nodes] + go_right
+        margins.append(arrays['leaf_value'][nodes] @ arrays['tree_class'])
+    return np.concatenate(margins).reshape(len(transformed), -1) + arrays['intercept']
+
+
+def export_native_model(model, path, feature_columns=None, preprocessor=None):
+    """
+    Exports a PA model to a single .npz of NumPy arrays that NativePredictor can score without sklearn's pipeline, xgboost or
+    TensorFlow. The preprocessing is compiled like CompiledPipeline, the estimator is either a stack of dense layers
+    (LogisticRegression, MLPClassifier and Keras Dense models) or a flattened array of XGBoost trees.
+
+    Args:
+        model: A fitted ml_pipe(model) pipeline, or a Keras model (or the path of a saved .keras model).
+        path (str): Where to save the .npz.
+        feature_columns (list, optional): The column order of the feature rows, defaults to the columns the pipeline was fit on.
+        preprocessor (Pipeline, optional): The fitted ml_pipe() used to train a Keras model. Without one the Keras model is
+                                           fed already preprocessed rows.
+
+    Returns:
+        NativePredictor: The exported model, as it will be loaded.
+
+    Example:
+        export_native_model(XGBoost_model, 'data/models/XGBoost_model.npz')
+        predictor = NativePredictor.load('data/models/XGBoost_model.npz')
+    """
+    if isinstance(model, str):
+        import keras
+        model = keras.saving.load_model(model)
+
+    if isinstance(model, Pipeline):
+        preprocessor, estimator = model, model.steps[-1][1]
+    else:
+        estimator = model
+    if preprocessor is not None:
+        compiled = CompiledPipeline(preprocessor, preprocessor.feature_names_in_ if feature_columns is None else feature_columns)
+        feature_columns, weights, bias, categorical = compiled.feature_columns, compiled.weights, compiled.bias, compiled.categorical
+        sparse_output = compiled.sparse_output
+    else:
+        # Rows are already preprocessed, so the preprocessing is the identity
+        n_inputs = estimator.n_features_in_ if hasattr(estimator, 'n_features_in_') else estimator.input_shape[-1]
+        feature_columns = [str(i) for i in range(n_inputs)] if feature_columns is None else list(feature_columns)
+        weights, bias, categorical, sparse_output = np.eye(n_inputs), np.zeros(n_inputs), [], False
+
+    module = type(estimator).__module__
+    if isinstance(estimator, LogisticRegression):
+        meta, arrays = _export_logistic(estimator)
+    elif isinstance(estimator, MLPClassifier):
+        meta, arrays = _export_mlp(estimator)
+    elif module.startswith('xgboost'):
+        meta, arrays = _export_xgboost(estimator)
+    elif module.startswith(('keras', 'tensorflow', 'tf_keras')):
+        meta, arrays = _export_keras(estimator)
+    else:
+        raise ValueError(f'Can not export a {type(estimator).__name__}')
+
+    # Categories are saved as strings, which is what the categorical columns hold
+    meta['sparse_output'] = bool(sparse_output)
+    np.savez(path, meta=json.dumps(meta), feature_columns=np.array(feature_columns, dtype=str), weights=weights, bias=bias,
+             categorical_columns=np.array([column for column, _, _ in categorical], dtype=int),
+             categorical_offsets=np.array([offset for _, offset, _ in categorical], dtype=int),
+             categorical_sizes=np.array([len(categories) for _, _, categories in categorical], dtype=int),
+             categories=np.array([str(category) for _, _, categories in categorical for category in categories], dtype=str),
+             **arrays)
+    return NativePredictor.load(path)
+
+
+class NativePredictor(CompiledPipeline):
+    """
+    A PA model exported by export_native_model, scored with NumPy alone. It works like a CompiledPipeline: predict_proba takes
+    feature rows in feature_columns order and bind precomputes the fixed part of a set of matchup rows.
+
+    Example:
+        predictor = NativePredictor.load('data/models/XGBoost_model.npz')
+        probabilities = predictor.predict_proba(feature_rows)
+    """
+    def __init__(self, arrays):
+        meta = json.loads(str(arrays['meta']))
+        self.kind = meta['kind']
+        self.sparse_output = meta['sparse_output']
+        self.feature_columns = list(arrays['feature_columns'])
+        self.weights, self.bias = arrays['weights'], arrays['bias']
+        self.n_outputs = len(self.bias)
+        self.linear_columns = np.flatnonzero(self.weights.any(axis=1))
+
+        self.categorical = []
+        categories = np.split(arrays['categories'], np.cumsum(arrays['categorical_sizes'])[:-1]) if len(arrays['categorical_sizes']) else []
+        for column, offset, column_categories in zip(arrays['categorical_columns'], arrays['categorical_offsets'], categories):
+            self.categorical.append((int(column), int(offset), {category: i for i, category in enumerate(column_categories)}))
+
+        if self.kind == 'layers':
+            self.layers = [(arrays[f'layer_{i}_weights'], arrays[f'layer_{i}_bias'], ACTIVATIONS[activation])
+                           for i, activation in enumerate(meta['activations'])]
+        else:
+            self.trees = {name: arrays[name] for name in ['feature', 'threshold', 'left', 'default_right', 'leaf_value', 'roots',
+                                                           'tree_class', 'intercept']}
+            self.max_depth = meta['max_depth']
+            self.output = ACTIVATIONS[meta['output']]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def _predict_transformed(self, transformed):
+        if self.kind == 'layers':
+            for weights, bias, activation in self.layers:
+                transformed = activation(transformed @ weights + bias)
+            return transformed
+
+        if self.sparse_output:
+            # XGBoost treats the entries left out of a sparse matrix as missing
+            transformed = np.where(transformed == 0, np.nan, transformed)
+        return self.output(_tree_margins(self.trees, self.max_depth, transformed))
+
+
+def verify_native_model(predictor, model, features, preprocessor=None, atol=1e-6):
+    """
+    Checks that an exported model gives the same probabilities as the original on some feature rows.
+
+    Args:
+        predictor (NativePredictor): The exported model.
+        model: The original ml_pipe(model) pipeline or Keras model.
+        features (pd.DataFrame): Feature rows with (at least) the predictor's feature_columns.
+        preprocessor (Pipeline, optional): The fitted ml_pipe() used to train a Keras model.
+        atol (float): The largest absolute difference allowed.
+
+    Returns:
+        float: The largest absolute difference between the two.
+
+    Raises:
+        ValueError: If the largest difference is over atol.
+    """
+    if isinstance(model, Pipeline):
+        expected = model.predict_proba(features)
+    else:
+        inputs = features.values if preprocessor is None else preprocessor.transform(features)
+        expected = np.asarray(model.predict(inputs, verbose=0))
+    difference = np.abs(predictor.predict_proba(features[predictor.feature_columns].values) - expected).max()
+    if difference > atol:
+        raise ValueError(f'The exported model is off by up to {difference} (more than {atol})')
+    return difference
+
+
+if __name__ == '__main__':
+    # Export the saved pipelines next to their pickles. The Keras model needs the ml_pipe() it was trained with, see export_native_model
+    for name in ['logistic_regression_model', 'XGBoost_model']:
+        with open(f'data/models/{name}.pkl', 'rb') as fpath:
+            model = pkl.load(fpath)
+        export_native_model(model, f'data/models/{name}.npz')
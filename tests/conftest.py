@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The modules import each other the way they are run: the packages from src/mlb_simulation (build_datasets.constants,
+# train_models.utils, ...) and the simulation modules as siblings from inside simulate_games
+PACKAGE_DIR = Path(__file__).resolve().parents[1] / 'src' / 'mlb_simulation'
+sys.path[:0] = [str(PACKAGE_DIR), str(PACKAGE_DIR / 'simulate_games')]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+# simulate.py pulls in the lineup scraper and the dataset builder's cloud helpers at import time
+pytest.importorskip('get_lineups')
+pytest.importorskip('multimodal_communication')
+
+from benchmark import synthetic_fixtures, BENCHMARK_DATE
+from daily_context import DailyContext
+from sampling import OutcomeSampler
+from simulate import GameSimulation
+from adaptive import simulate_until_converged, player_stat_over, home_win_probability
+
+
+@pytest.fixture(scope='module')
+def game():
+    fixtures = synthetic_fixtures(n_games=1, n_rows=2000)
+    context = DailyContext(BENCHMARK_DATE, fixtures['daily_stats'], fixtures['expected_weather'], fixtures['name_conversions'])
+    lineup = fixtures['lineups'][0]
+    game = GameSimulation(BENCHMARK_DATE, lineup['home_team'], lineup, fixtures['model'], fixtures['encoder'], innings_to_simulate=9,
+                          context=context, instrumentation=False)
+    game.compile_outcome_probabilities()
+    game.sampler = OutcomeSampler(0)
+    return game, lineup['home_lineup'][1]['id']
+
+
+def test_never_hit_threshold_does_not_converge_early(game):
+    game, batter_id = game
+    # No batter hits 10 home runs in a game, so every value is 0, but 1000 games can't pin the chance down to 0.001
+    results = simulate_until_converged(game, [player_stat_over(batter_id, 'home_runs', 9.5, precision=0.001)], batch_size=500,
+                                       min_sims=1000, max_sims=1000)
+    result = results.iloc[0]
+    assert result.estimate == 0
+    assert 0.001 < result.half_width < np.inf
+    assert not result.converged
+
+
+def test_binary_target_converges(game):
+    game, _ = game
+    result = simulate_until_converged(game, [home_win_probability(precision=0.05)], batch_size=500, min_sims=500).iloc[0]
+    assert result.converged
+    # Away from 0 and 1 the Wilson interval is about as wide as the normal one
+    assert result.half_width == pytest.approx(1.96 * np.sqrt(result.estimate * (1 - result.estimate) / result.n_sims), rel=0.05)
@@ -0,0 +1,161 @@
+import itertools
+import numpy as np
+import pytest
+
+import build_datasets.constants as constants
+from base_running import base_running_transitions
+
+
+# The outcomes the PA models predict (intent walks are labelled as walks)
+OUTCOMES = [play for play in constants.PLAY_TYPES if play != 'intent_walk']
+
+# Every probability the old rules compare a uniform against. Between two of these every uniform takes the same path, so
+# playing one uniform per interval, weighted by its width, gives the exact odds of each result
+THRESHOLDS = [0, 0.01, 0.38, 0.40, 0.62, 0.75, 1]
+UNIFORMS = [((low + high) / 2, high - low) for low, high in zip(THRESHOLDS[:-1], THRESHOLDS[1:])]
+MAX_UNIFORMS = 4 # An error that turns into a single with runners on 1st and 2nd
+
+
+def old_handle_outcome(outcome, on_1b, on_2b, on_3b, outs, random):
+    '''The runner rules of the old if/else handle_outcome (with handle_base_hit, advance_runners and handle_home_run),
+    written against random(), a uniform draw. Returns (on_1b, on_2b, on_3b, outs, runs, rbis). The quirks are kept: a walk
+    never moves the runners (the old branches compared instead of assigning) and only scores with the bases loaded, the
+    batter is put on his base before the runners move (so he can score with them), and a home run is 1 rbi'''
+    runs, rbis = 0, 0
+
+    def base_hit(bases):
+        nonlocal on_1b, on_2b, on_3b, runs, rbis
+        if bases == 1:
+            on_1b = 1
+        elif bases == 2:
+            on_2b = 1
+        else:
+            on_3b = 1
+
+        if bases == 1:
+            if on_3b:
+                runs, rbis, on_3b = runs + 1, rbis + 1, 0
+            runner_on_2b_scores = on_2b and random() < 0.62
+            runner_on_1b_scores = on_1b and random() < 0.01
+            runner_on_1b_advances = on_1b and runner_on_2b_scores and random() < 0.40
+            if runner_on_2b_scores:
+                runs, rbis, on_2b = runs + 1, rbis + 1, 0
+            if runner_on_1b_scores:
+                runs, rbis, on_1b = runs + 1, rbis + 1, 0
+            elif runner_on_1b_advances:
+                on_3b, on_1b = on_1b, 0
+            else:
+                on_2b = on_1b
+            on_1b = 1
+        elif bases == 2:
+            if on_3b:
+                runs, rbis, on_3b = runs + 1, rbis + 1, 0
+            if on_2b:
+                runs, rbis, on_2b = runs + 1, rbis + 1, 0
+            if on_1b and random() < 0.38:
+                runs, rbis, on_1b = runs + 1, rbis + 1, 0
+            else:
+                on_3b = on_1b
+            on_2b, on_1b = 1, 0
+        else:
+            for runner in (on_3b, on_2b, on_1b):
+                if runner != 0:
+                    runs, rbis = runs + 1, rbis + 1
+            on_3b, on_2b, on_1b = 1, 0, 0
+
+    if outcome in ('strikeout', 'field_out'):
+        outs += 1
+    elif outcome == 'walk':
+        if on_1b and on_2b and on_3b:
+            runs += 1
+    elif outcome == 'single':
+        base_hit(1)
+    elif outcome == 'double':
+        base_hit(2)
+    elif outcome == 'triple':
+        base_hit(3)
+    elif outcome == 'home_run':
+        runs += on_1b + on_2b + on_3b + 1
+        on_1b, on_2b, on_3b = 0, 0, 0
+        rbis += on_1b + on_2b + on_3b + 1
+    elif outcome == 'error':
+        base_hit(2 if random() > 0.75 else 1)
+    elif outcome == 'double_play':
+        outs += 2
+        if on_1b and on_2b:
+            on_1b, on_2b = 0, 0
+        elif on_2b and on_3b:
+            on_2b, on_3b = 0, 0
+        elif on_1b and on_3b:
+            on_1b = 0
+            if outs < 3:
+                on_3b, runs = 0, runs + 1
+        else:
+            if on_3b:
+                on_3b = 0
+            elif on_2b:
+                on_2b = 0
+            elif on_1b:
+                on_1b = 0
+    elif outcome == 'sacrifice':
+        outs += 1
+        if on_3b:
+            on_3b, runs = 0, runs + 1
+        if on_2b:
+            on_2b, on_3b = 0, 1
+        if on_1b:
+            on_1b, on_2b = 0, 1
+    elif outcome == 'fielders_choice':
+        outs += 1
+        if on_3b:
+            on_3b = 0
+            if on_2b:
+                on_2b, on_3b = 0, 1
+            if on_1b:
+                on_1b, on_2b = 0, 1
+        elif on_2b:
+            on_2b, on_3b = 0, 1
+            if on_1b:
+                on_1b, on_2b = 0, 1
+        on_1b = 1
+
+    return on_1b, on_2b, on_3b, outs, runs, rbis
+
+
+def old_rule_odds(outcome, bases, outs):
+    # {(new bases, new outs, runs, rbis): probability} of the old rules, over every combination of uniform intervals
+    odds = {}
+    for draws in itertools.product(UNIFORMS, repeat=MAX_UNIFORMS):
+        uniforms = iter(uniform for uniform, _ in draws)
+        on_1b, on_2b, on_3b, new_outs, runs, rbis = old_handle_outcome(outcome, bases % 2, bases // 2 % 2, bases // 4, outs,
+                                                                      lambda: next(uniforms))
+        key = (on_1b + 2*on_2b + 4*on_3b, new_outs, runs, rbis)
+        odds[key] = odds.get(key, 0) + np.prod([width for _, width in draws])
+    return odds
+
+
+@pytest.fixture(scope='module')
+def transitions():
+    return base_running_transitions(OUTCOMES)
+
+
+@pytest.mark.parametrize('outcome', OUTCOMES)
+def test_transitions_match_old_rules(transitions, outcome):
+    code = OUTCOMES.index(outcome)
+    for bases in range(8):
+        for outs in range(3):
+            table = {(new_bases, new_outs, runs, rbis): probability
+                     for probability, new_bases, new_outs, runs, rbis in transitions[code][bases][outs]}
+            expected = old_rule_odds(outcome, bases, outs)
+            assert table.keys() == expected.keys(), (outcome, bases, outs)
+            for result, probability in expected.items():
+                assert table[result] == pytest.approx(probability), (outcome, bases, outs, result)
+
+
+def test_kept_quirks(transitions):
+    walk, home_run = OUTCOMES.index('walk'), OUTCOMES.index('home_run')
+    # A walk leaves the runners where they are and only scores with the bases loaded
+    assert transitions[walk][1][0] == [(1.0, 1, 0, 0, 0)]
+    assert transitions[walk][7][0] == [(1.0, 7, 0, 1, 0)]
+    # A grand slam is 4 runs but 1 rbi
+    assert transitions[home_run][7][2] == [(1.0, 0, 2, 4, 1)]
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# The dataset builder pulls in the cloud helpers and IPython at import time
+pytest.importorskip('multimodal_communication')
+pytest.importorskip('IPython')
+
+from build_datasets.dataset_builder import DatasetBuilder
+
+
+# (game_pk, inning, inning_topbot, at_bat_number, events, bases, outs_when_up, bat_score, post_bat_score, fld_score)
+PLAYS = [
+    # A normal half inning
+    (1, 1, 'Top', 1, 'single', 0, 0, 0, 0, 0),
+    (1, 1, 'Top', 2, 'strikeout', 1, 0, 0, 0, 0),
+    (1, 1, 'Top', 3, 'home_run', 1, 1, 0, 2, 0),
+    (1, 1, 'Top', 4, 'field_out', 0, 1, 2, 2, 0),
+    (1, 1, 'Top', 5, None, 0, 2, 2, 2, 0), # A pitch that didn't end the plate appearance
+    (1, 1, 'Top', 5, 'strikeout', 0, 2, 2, 2, 0),
+    # Ended on a double play
+    (1, 1, 'Bot', 6, 'field_out', 0, 0, 0, 0, 2),
+    (1, 1, 'Bot', 7, 'single', 0, 1, 0, 0, 2),
+    (1, 1, 'Bot', 8, 'grounded_into_double_play', 1, 1, 0, 0, 2),
+    # A runner caught stealing on a play of its own, then a half inning ended by a caught stealing after the last plate appearance
+    (1, 2, 'Top', 9, 'single', 0, 0, 2, 2, 0),
+    (1, 2, 'Top', 10, 'caught_stealing_2b', 1, 0, 2, 2, 0),
+    (1, 2, 'Top', 11, 'field_out', 0, 1, 2, 2, 0),
+    (1, 2, 'Top', 12, 'single', 0, 2, 2, 2, 0),
+    # A walk off
+    (2, 9, 'Bot', 1, 'single', 0, 0, 3, 3, 4),
+    (2, 9, 'Bot', 2, 'home_run', 1, 0, 3, 5, 4),
+    # The last play of a bottom of the 9th that isn't a walk off
+    (3, 9, 'Bot', 1, 'strikeout', 0, 2, 2, 2, 4),
+]
+
+
+def statcast_plays(plays):
+    columns = ['game_pk', 'inning', 'inning_topbot', 'at_bat_number', 'events', 'bases', 'outs_when_up', 'bat_score', 'post_bat_score', 'fld_score']
+    df = pd.DataFrame(plays, columns=columns)
+    for base, bit in [('on_1b', 1), ('on_2b', 2), ('on_3b', 4)]:
+        df[base] = np.where(df.bases & bit, 660000.0, np.nan)
+    return df.drop(columns='bases').assign(game_type='R')
+
+
+def test_base_running_tables_counts():
+    tables = DatasetBuilder().build_base_running_tables(statcast_plays(PLAYS))
+    outcomes = list(tables['outcomes'])
+    counts = {(outcomes[index[0]], *index[1:]): count for index, count in np.ndenumerate(tables['counts']) if count}
+
+    # (outcome, bases, outs, new bases, new outs, runs). The walk off home run and the single before the caught stealing
+    # that ended the 2nd aren't counted, and neither is the caught stealing itself
+    assert counts == {
+        ('single', 0, 0, 1, 0, 0): 3,
+        ('strikeout', 1, 0, 1, 1, 0): 1,
+        ('home_run', 1, 1, 0, 1, 2): 1,
+        ('field_out', 0, 1, 0, 2, 0): 2,
+        ('strikeout', 0, 2, 0, 3, 0): 2,
+        ('field_out', 0, 0, 0, 1, 0): 1,
+        ('single', 0, 1, 1, 1, 0): 1,
+        ('double_play', 1, 1, 0, 3, 0): 1,
+    }
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from sklearn.neural_network import MLPClassifier
+
+# The synthetic fixtures live with the simulation benchmarks, which import the simulator
+pytest.importorskip('get_lineups')
+pytest.importorskip('multimodal_communication')
+
+from benchmark import synthetic_teams, synthetic_daily_stats, synthetic_model
+from train_models.utils import ml_pipe
+from train_models.native import export_native_model, NativePredictor, verify_native_model
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    daily_stats = synthetic_daily_stats(synthetic_teams(2), n_rows=2000)
+    features = daily_stats.drop(columns=['play_type', 'is_on_base']).astype({'ballpark': object, 'pitbat': object})
+    return features, daily_stats.play_type
+
+
+def assert_round_trip(model, path, features, preprocessor=None):
+    # Exports model to path, loads it back and compares its probabilities with the original's
+    export_native_model(model, str(path), preprocessor=preprocessor)
+    predictor = NativePredictor.load(str(path))
+    rows = features[predictor.feature_columns].values
+    if preprocessor is None:
+        expected = model.predict_proba(features)
+    else:
+        expected = np.asarray(model.predict(preprocessor.transform(features), verbose=0))
+    assert np.allclose(predictor.predict_proba(rows), expected, atol=1e-6)
+    assert verify_native_model(predictor, model, features, preprocessor=preprocessor, atol=1e-5) <= 1e-5
+
+
+def test_logistic_round_trip(dataset, tmp_path):
+    features, labels = dataset
+    model, _ = synthetic_model(features.assign(play_type=labels, is_on_base=0))
+    assert_round_trip(model, tmp_path / 'logistic.npz', features)
+
+
+def test_mlp_round_trip(dataset, tmp_path):
+    features, labels = dataset
+    model = ml_pipe(MLPClassifier((16, 8), max_iter=50, random_state=0)).fit(features, labels)
+    assert_round_trip(model, tmp_path / 'mlp.npz', features)
+
+
+def test_xgboost_round_trip(dataset, tmp_path):
+    xgboost = pytest.importorskip('xgboost')
+    features, labels = dataset
+    codes = labels.astype('category').cat.codes
+    model = ml_pipe(xgboost.XGBClassifier(n_estimators=20, max_depth=4, random_state=0)).fit(features, codes)
+    assert_round_trip(model, tmp_path / 'xgboost.npz', features)
+
+
+def test_keras_round_trip(dataset, tmp_path):
+    keras = pytest.importorskip('keras')
+    features, labels = dataset
+    preprocessor = ml_pipe().fit(features)
+    n_inputs = preprocessor.transform(features[:1]).shape[1]
+    model = keras.Sequential([keras.Input((n_inputs,)), keras.layers.Dense(16, activation='relu'), keras.layers.BatchNormalization(),
+                              keras.layers.Dropout(0.2), keras.layers.Dense(labels.nunique(), activation='softmax')])
+    assert_round_trip(model, tmp_path / 'keras.npz', features, preprocessor=preprocessor)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# simulate.py pulls in the lineup scraper and the dataset builder's cloud helpers at import time
+pytest.importorskip('get_lineups')
+pytest.importorskip('multimodal_communication')
+
+from benchmark import synthetic_fixtures, BENCHMARK_DATE
+from daily_context import DailyContext
+from simulate import GameSimulation
+from season import SeasonSimulation
+
+
+PAIRING_GAMES = 4000
+SAMPLED_GAMES = 20000
+
+
+@pytest.fixture(scope='module')
+def fixtures():
+    return synthetic_fixtures(n_games=1, n_rows=2000)
+
+
+@pytest.fixture(scope='module')
+def season(fixtures):
+    # Two teams hosting each other once, so the schedule has two pairings
+    context = DailyContext(BENCHMARK_DATE, fixtures['daily_stats'], fixtures['expected_weather'], fixtures['name_conversions'])
+    game = fixtures['lineups'][0]
+    lineups = {game[f'{side}_team']: {'lineup': game[f'{side}_lineup'], 'rotation': [game[f'{side}_pitcher']]} for side in ['home', 'away']}
+    schedule = pd.DataFrame({'home_team': [game['home_team'], game['away_team']], 'away_team': [game['away_team'], game['home_team']]})
+    return SeasonSimulation(BENCHMARK_DATE, schedule, lineups, fixtures['model'], fixtures['encoder'], context=context,
+                            games_per_pairing=PAIRING_GAMES, seed=0, max_workers=2)
+
+
+@pytest.fixture(scope='module')
+def sampled_runs(fixtures, season):
+    # Fresh (home, away) runs of every pairing, played by GameSimulation on its own
+    runs = []
+    for pairing in season.pairings:
+        game = GameSimulation(BENCHMARK_DATE, pairing['home_team'], pairing, fixtures['model'], fixtures['encoder'], innings_to_simulate=9,
+                              rng=1, context=season.context, instrumentation=False)
+        game.compile_outcome_probabilities()
+        runs.append(game.simulate_games_arrays(SAMPLED_GAMES)[2])
+    return runs
+
+
+def test_pairing_odds_match_sampled_games(season, sampled_runs):
+    for row, runs in zip(season.pairing_odds().itertuples(), sampled_runs):
+        # Within 4.5 standard errors of the difference between the pairing's games and the sampled ones
+        for chance, sampled in [(row.home_win, runs[:, 0] > runs[:, 1]), (row.away_win, runs[:, 0] < runs[:, 1]),
+                                (row.tie, runs[:, 0] == runs[:, 1])]:
+            standard_error = np.sqrt(sampled.mean() * (1 - sampled.mean()) * (1 / PAIRING_GAMES + 1 / SAMPLED_GAMES))
+            assert abs(chance - sampled.mean()) < 4.5 * standard_error
+
+
+def test_season_runs_match_sampled_games(season, sampled_runs):
+    # Every team plays one home and one away game a season, so its runs scored are its runs in both pairings
+    summary = season.simulate(2000, chunk_size=500, seed=0).summary()
+    for team in season.teams:
+        home = next(i for i, pairing in enumerate(season.pairings) if pairing['home_team'] == team)
+        away = next(i for i, pairing in enumerate(season.pairings) if pairing['away_team'] == team)
+        team_runs = sampled_runs[home][:, 0].mean() + sampled_runs[away][:, 1].mean()
+        standard_error = np.sqrt((sampled_runs[home][:, 0].var() + sampled_runs[away][:, 1].var()) * (1 / PAIRING_GAMES + 1 / 2000))
+        assert abs(summary.runs_scored[team] - team_runs) < 4.5 * standard_error
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+# simulate.py pulls in the lineup scraper and the dataset builder's cloud helpers at import time
+pytest.importorskip('get_lineups')
+pytest.importorskip('multimodal_communication')
+
+from benchmark import synthetic_fixtures, BENCHMARK_DATE
+from daily_context import DailyContext
+from sampling import OutcomeSampler
+from simulate import GameSimulation
+
+
+SCALAR_GAMES = 1000
+BATCH_GAMES = 20000
+
+
+def make_game():
+    fixtures = synthetic_fixtures(n_games=1, n_rows=2000)
+    context = DailyContext(BENCHMARK_DATE, fixtures['daily_stats'], fixtures['expected_weather'], fixtures['name_conversions'])
+    lineup = fixtures['lineups'][0]
+    return GameSimulation(BENCHMARK_DATE, lineup['home_team'], lineup, fixtures['model'], fixtures['encoder'], innings_to_simulate=9,
+                          context=context, instrumentation=False)
+
+
+@pytest.fixture(scope='module')
+def game():
+    game = make_game()
+    # Both engines read the same outcome probabilities once compiled, so any difference left is in how they play the games out
+    game.compile_outcome_probabilities()
+    return game
+
+
+@pytest.fixture(scope='module')
+def tied_game():
+    game = make_game()
+    # run_distributions holds the score features at a tie, so the simulated games have to see a tie throughout too
+    game.compile_outcome_probabilities(max_score_diff=0)
+    return game
+
+
+def test_batch_engine_matches_scalar_engine(game):
+    game.sampler = OutcomeSampler(1)
+    scalar_runs = np.array([[score['home'], score['away']] for _, _, score in (game.simulate_game() for _ in range(SCALAR_GAMES))])
+    game.sampler = OutcomeSampler(2)
+    batch_runs = game.simulate_games_arrays(BATCH_GAMES)[2]
+
+    # Runs per team (home, away): the means within 4.5 standard errors of their difference, the variances within 20%
+    standard_error = np.sqrt(scalar_runs.var(axis=0) / SCALAR_GAMES + batch_runs.var(axis=0) / BATCH_GAMES)
+    assert np.all(np.abs(scalar_runs.mean(axis=0) - batch_runs.mean(axis=0)) < 4.5 * standard_error)
+    assert np.allclose(scalar_runs.var(axis=0), batch_runs.var(axis=0), rtol=0.2)
+
+
+def test_run_distributions_match_simulated_games(tied_game):
+    distributions = tied_game.run_distributions()
+    tied_game.sampler = OutcomeSampler(3)
+    runs = tied_game.simulate_games_arrays(BATCH_GAMES)[2]
+
+    # The analytic run means (home, away) and home win chance within 4.5 standard errors of the simulated ones
+    expected_runs = np.array([distributions[side] @ np.arange(len(distributions[side])) for side in ['home', 'away']])
+    assert np.all(np.abs(runs.mean(axis=0) - expected_runs) < 4.5 * runs.std(axis=0) / np.sqrt(BATCH_GAMES))
+    home_wins = runs[:, 0] > runs[:, 1]
+    assert abs(home_wins.mean() - distributions['home_win']) < 4.5 * np.sqrt(distributions['home_win'] * (1 - distributions['home_win']) / BATCH_GAMES)